@@ -158,7 +158,7 @@ Original Comments
 > 	- dwh
 """
 
-import math, re, socket, select, string, struct, sys, threading, time, types, array, errno, inspect
+import math, os, re, socket, select, string, struct, sys, threading, time, types, array, errno, inspect
 from SocketServer import UDPServer, DatagramRequestHandler, ForkingMixIn, ThreadingMixIn, StreamRequestHandler, TCPServer
 from contextlib import closing
 
@@ -205,6 +205,35 @@ try:
 except ImportError:
 	pass
 
+##
+# sendmmsg() support (Linux only):
+##
+
+_sendmmsg = None
+
+if sys.platform.startswith('linux'):
+	try:
+		import ctypes, ctypes.util
+
+		class _iovec(ctypes.Structure):
+			_fields_ = [("iov_base", ctypes.c_char_p), ("iov_len", ctypes.c_size_t)]
+
+		class _msghdr(ctypes.Structure):
+			_fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+						("msg_iov", ctypes.c_void_p), ("msg_iovlen", ctypes.c_size_t),
+						("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+						("msg_flags", ctypes.c_int)]
+
+		class _mmsghdr(ctypes.Structure):
+			_fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+		_sendmmsg = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True).sendmmsg
+		_sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+		_sendmmsg.restype = ctypes.c_int
+
+	except (ImportError, OSError, AttributeError):
+		_sendmmsg = None
+
 ######
 #
 # OSCMessage classes
@@ -280,6 +309,14 @@ class OSCMessage(object):
 			raise TypeError("Can only append 'OSCMessage' to 'OSCBundle'")
 		
 		if hasattr(argument, '__iter__'):
+                        # Encode lists of ints, floats and strings in one go
+                        if typehint is None and type(argument) in (types.ListType, types.TupleType):
+                                tags, binary = OSCArguments(argument)
+                                if tags is not None:
+                                        self.typetags += tags
+                                        self.message += binary
+                                        return
+                        
                         for arg in argument:
                                 self.append(arg, typehint)
                         
@@ -701,14 +738,44 @@ class OSCBundle(OSCMessage):
 #
 ######
 
+_OSCStringCache = {}
+_OSCStructCache = {}
+
+_OSCFloat = struct.Struct(">f")
+_OSCInt = struct.Struct(">i")
+_OSCDouble = struct.Struct(">d")
+
+def _getStruct(fmt):
+	"""Returns a (cached) struct.Struct for the format string 'fmt'
+	"""
+	try:
+		return _OSCStructCache[fmt]
+	except KeyError:
+		if len(_OSCStructCache) > 4096:
+			_OSCStructCache.clear()
+		compiled = _OSCStructCache[fmt] = struct.Struct(fmt)
+		return compiled
+
 def OSCString(next):
 	"""Convert a string into a zero-padded OSC String.
 	The length of the resulting string is always a multiple of 4 bytes.
 	The string ends with 1 to 4 zero-bytes ('\x00') 
 	"""
-	
-	OSCstringLength = math.ceil((len(next)+1) / 4.0) * 4
-	return struct.pack(">%ds" % (OSCstringLength), str(next))
+	try:
+		return _OSCStringCache[next]
+	except (KeyError, TypeError):
+		pass
+
+	OSCstringLength = (len(next) + 4) & ~3
+	binary = struct.pack(">%ds" % (OSCstringLength), str(next))
+
+	# Addresses, type tags and SynthDef / argument names are re-used a lot
+	if type(next) is types.StringType and len(next) <= 64:
+		if len(_OSCStringCache) > 4096:
+			_OSCStringCache.clear()
+		_OSCStringCache[next] = binary
+
+	return binary
 
 def OSCBlob(next):
 	"""Convert a string into an OSC Blob.
@@ -718,7 +785,7 @@ def OSCBlob(next):
 	"""
 
 	if type(next) in types.StringTypes:
-		OSCblobLength = math.ceil((len(next)) / 4.0) * 4
+		OSCblobLength = (len(next) + 3) & ~3
 		binary = struct.pack(">i%ds" % (OSCblobLength), OSCblobLength, next)
 	else:
 		binary = ""
@@ -732,10 +799,10 @@ def OSCArgument(next, typehint=None):
 	"""
 	if not typehint:
 		if type(next) in FloatTypes:
-			binary  = struct.pack(">f", float(next))
+			binary  = _OSCFloat.pack(float(next))
 			tag = 'f'
 		elif type(next) in IntTypes:
-			binary  = struct.pack(">i", int(next))
+			binary  = _OSCInt.pack(int(next))
 			tag = 'i'
 		else:
 			binary  = OSCString(next)
@@ -743,7 +810,7 @@ def OSCArgument(next, typehint=None):
 
 	elif typehint == 'd':
 		try:
-			binary  = struct.pack(">d", float(next))
+			binary  = _OSCDouble.pack(float(next))
 			tag = 'd'
 		except ValueError:
 			binary  = OSCString(next)
@@ -751,14 +818,14 @@ def OSCArgument(next, typehint=None):
 
 	elif typehint == 'f':
 		try:
-			binary  = struct.pack(">f", float(next))
+			binary  = _OSCFloat.pack(float(next))
 			tag = 'f'
 		except ValueError:
 			binary  = OSCString(next)
 			tag = 's'
 	elif typehint == 'i':
 		try:
-			binary  = struct.pack(">i", int(next))
+			binary  = _OSCInt.pack(int(next))
 			tag = 'i'
 		except ValueError:
 			binary  = OSCString(next)
@@ -769,6 +836,33 @@ def OSCArgument(next, typehint=None):
 
 	return (tag, binary)
 
+def OSCArguments(args):
+	"""Convert a list of ints, floats and strings to their OSC binary
+	representation with a single struct.pack, returning a (typetags, data)
+	tuple. Returns (None, None) if any argument is of another type.
+	"""
+	tags = []
+	fmt = [">"]
+	values = []
+
+	for next in args:
+		if type(next) in FloatTypes:
+			tags.append('f')
+			fmt.append('f')
+			values.append(float(next))
+		elif type(next) in IntTypes:
+			tags.append('i')
+			fmt.append('i')
+			values.append(int(next))
+		elif type(next) is types.StringType:
+			tags.append('s')
+			fmt.append("%ds" % ((len(next) + 4) & ~3))
+			values.append(next)
+		else:
+			return (None, None)
+
+	return ("".join(tags), _getStruct("".join(fmt)).pack(*values))
+
 def OSCTimeTag(time):
 	"""Convert a time in floating seconds to its
 	OSC binary representation
@@ -1221,6 +1315,67 @@ class OSCClient(object):
 			else:
 				raise OSCClientError("while sending: %s" % str(e))
 
+	def sendBatch(self, msgs, timeout=None):
+		"""Send a list of OSCMessages (or OSCBundles) in order.
+		On Linux the messages are handed to the kernel together using sendmmsg(),
+		elsewhere each one is sent using send().
+		If a message can't be sent, the rest are still sent before the error is raised.
+		"""
+		if _sendmmsg is None or len(msgs) < 2:
+			for msg in msgs:
+				self.send(msg, timeout)
+			return
+
+		for msg in msgs:
+			if not isinstance(msg, OSCMessage):
+				raise TypeError("'msg' argument is not an OSCMessage or OSCBundle object")
+
+		if not self.socket:
+			raise OSCClientError("Called sendBatch() on non-connected client")
+
+		binaries = [msg.getBinary() for msg in msgs]
+		count = len(binaries)
+
+		iovecs = (_iovec * count)()
+		headers = (_mmsghdr * count)()
+
+		for i, binary in enumerate(binaries):
+			iovecs[i].iov_base = binary
+			iovecs[i].iov_len = len(binary)
+			headers[i].msg_hdr.msg_iov = ctypes.addressof(iovecs) + i * ctypes.sizeof(_iovec)
+			headers[i].msg_hdr.msg_iovlen = 1
+
+		sent = 0
+		error = None
+
+		while sent < count:
+			ret = select.select([],[self._fd], [], timeout)
+			try:
+				ret[1].index(self._fd)
+			except:
+				raise OSCClientError("Timed out waiting for file descriptor")
+
+			n = _sendmmsg(self._fd, ctypes.addressof(headers) + sent * ctypes.sizeof(_mmsghdr), count - sent, 0)
+
+			if n >= 0:
+				sent += n
+				continue
+
+			e = ctypes.get_errno()
+
+			if e in (errno.EINTR, errno.EAGAIN):
+				continue
+
+			# Skip the message that failed, as send() would
+			error = socket.error(e, os.strerror(e))
+			sent += 1
+
+		if error is not None:
+			if error[0] in (7, 65):	# 7 = 'no address associated with nodename',  65 = 'no route to host'
+				raise error
+			else:
+				raise OSCClientError("while sending: %s" % str(error))
+
 ######
 #
 # FilterString Utility functions
@@ -1,6 +1,7 @@
 from __future__ import division
 from random import choice, shuffle
 from copy import deepcopy
+import operator
 from Operations import *
 from utils import *
 from PlayString import PlayString
@@ -18,6 +19,26 @@ class metaPattern(object):
     bracket_style = "[]"
     debugging = False
 
+    # Set Pattern.lazy = True to calculate the values of arithmetic
+    # operations between Patterns when they're used, see LazyPattern.
+    # This is always done when the result is longer than lazy_size, which
+    # can be set to float("inf") to turn it off
+    lazy = False
+    lazy_size = 65536
+
+    # The length of a Pattern is stored with the data it was calculated from
+    # and the number of in-place changes made to any Pattern at that time.
+    # The count is shared because Patterns can share the same data list
+    len_cache = (None, -1, 0)
+    changes = 0
+
+    # Patterns with nested Patterns, and PGroups of PGroups, store the value
+    # at each index in a table when it is no larger than flat_size. Setting
+    # flat_size to 0 turns this off
+    flat_size = 4096
+    flat_cache  = (None, -1, None)
+    group_cache = (None, -1, None)
+
     def __init__(self, data=[]):
 
         if self.__class__ not in PATTERN_WEIGHTS:
@@ -42,8 +63,24 @@ class metaPattern(object):
             self.make()
             
     def __len__(self):
+        """ Returns the length of the Pattern once nested Patterns are expanded.
+            This is only calculated again if `data` is replaced or a Pattern
+            is changed in place """
+        data, changes, length = self.len_cache
+        if data is self.data and changes == metaPattern.changes:
+            return length
+        length = self.expanded_len()
+        self.len_cache = (self.data, metaPattern.changes, length)
+        return length
+
+    def expanded_len(self):
         lengths = [1] + [len(p) for p in self.data if isinstance(p, Pattern)]
         return LCM(*lengths) * len([item for item in self.data if not isinstance(item, EmptyItem)])
+
+    def changed(self):
+        """ Is called when a Pattern's data is changed in place """
+        metaPattern.changes += 1
+        return
     
     def __str__(self):
         try:
@@ -101,13 +138,59 @@ class metaPattern(object):
             i = key % len(self.data)
             val = self.data[i]
             if isinstance(val, Pattern):
-                j = key // len(self.data)
-                val = val.getitem(j)
+                table = self.flat_table()
+                if table is None:
+                    j = key // len(self.data)
+                    val = val.getitem(j)
+                else:
+                    val = table[key % len(table)]
+                    if isinstance(val, GeneratorPattern):
+                        val = val.getitem()
             elif isinstance(val, GeneratorPattern):
                 val = val.getitem()
         return val
+
+    def flat_table(self):
+        """ Returns a list of the values at each index with any nested Patterns
+            expanded, or None if they can't be stored. GeneratorPatterns are
+            stored as they are and evaluated when indexed """
+        data, changes, table = self.flat_cache
+        if data is self.data and changes == metaPattern.changes:
+            return table
+        table = self.make_flat_table()
+        self.flat_cache = (self.data, metaPattern.changes, table)
+        return table
+
+    def make_flat_table(self):
+        if type(self.data) is not list or len(self.data) == 0:
+            return None
+        size = len(self.data)
+        nested = {}
+        for i, item in enumerate(self.data):
+            if isinstance(item, Pattern):
+                # Subclasses, such as Pvar, can change their values over time
+                if type(item) is not Pattern:
+                    return None
+                nested[i] = item.flat_table()
+                if nested[i] is None:
+                    return None
+        if len(nested) == 0:
+            return self.data
+        period = size * LCM(*[len(values) for values in nested.values()])
+        if period > self.flat_size:
+            return None
+        table = []
+        for key in range(period):
+            i = key % size
+            if i in nested:
+                values = nested[i]
+                table.append(values[(key // size) % len(values)])
+            else:
+                table.append(self.data[i])
+        return table
     
     def __setitem__(self, key, value):
+        self.changed()
         i = key % len(self.data)
         if isinstance(self.data[i], metaPattern):
             j = key // len(self.data)
@@ -119,6 +202,7 @@ class metaPattern(object):
                 self.data[i] = Format(value)
 
     def setitem(self, key, value):
+        self.changed()
         self.data[key] = Format(value)
             
     def __iter__(self):
@@ -142,6 +226,7 @@ class metaPattern(object):
         return Pattern([self[i] for i in range(start, stop, step) ])
             
     def __setslice__(self, i, j, item):
+        self.changed()
         self.data[i:j] = Format(item)
 
     # count all values that occur?
@@ -207,13 +292,21 @@ class metaPattern(object):
         return PNe(self, other)
     
     def __gt__(self, other):
-        return Pattern([int(value > modi(asStream(other), i)) for i, value in enumerate(self)])
+        return self.compare(other, operator.gt)
     def __ge__(self, other):
-        return Pattern([int(value >= modi(asStream(other), i)) for i, value in enumerate(self)])
+        return self.compare(other, operator.ge)
     def __lt__(self, other):
-        return Pattern([int(value < modi(asStream(other), i)) for i, value in enumerate(self)])
+        return self.compare(other, operator.lt)
     def __le__(self, other):
-        return Pattern([int(value <= modi(asStream(other), i)) for i, value in enumerate(self)])
+        return self.compare(other, operator.le)
+
+    def compare(self, other, func):
+        """ Returns a Pattern of 1s and 0s for each value where func(value, other) is True """
+        other = asStream(other)
+        if is_numeric(self.data) and is_numeric(other.data):
+            size = len(self.data)
+            return Pattern(map(int, map(func, self.data, (other.data * (size // len(other.data) + 1))[:size])))
+        return Pattern([int(func(value, modi(other, i))) for i, value in enumerate(self)])
 
     # Methods for strings as pattern
 
@@ -278,15 +371,18 @@ class metaPattern(object):
     @loop_pattern_method
     def stretch(self, size):
         """ Stretches (repeats) the contents until len(Pattern) == size """
-        new = []
-        for n in range(size):
-            new.append( modi(self.data, n) )
+        if len(self.data) > 0:
+            new = (self.data * (size // len(self.data) + 1))[:size]
+        else:
+            new = [modi(self.data, n) for n in range(size)]
         new = self.__class__(new)
         return new
 
     @loop_pattern_method
     def loop(self, n):
         """ Repeats this pattern n times """
+        if is_numeric(self.data):
+            return self.__class__(self.data * n)
         new = []
         for i in range(n):
             new += list(self)
@@ -352,6 +448,9 @@ class metaPattern(object):
     def stutter(self, n=2):
         n = asStream(n)
         lrg = max(len(self.data), len(n))
+        if len(n) == 1 and len(self.data) > 0 and isinstance(n[0], (int, long)):
+            repeats = range(n[0])
+            return self.__class__([item for item in self.data for j in repeats])
         new = []
         for i in range(lrg):
             for j in range(modi(n,i)):
@@ -470,6 +569,7 @@ class metaPattern(object):
         return self
 
     def i_reverse(self):
+        self.changed()
         self.data.reverse()
         return self
 
@@ -478,10 +578,12 @@ class metaPattern(object):
         return self
 
     def i_shuf(self):
+        self.changed()
         shuffle(self.data)
         return self
 
     def set(self, index, value):
+        self.changed()
         self.data[index] = asStream(value)
         return self
 
@@ -579,13 +681,14 @@ class metaPattern(object):
             self.data = [self.data]
 
         #: Put any data in a tuple into a PGroup
-        for i, data in enumerate(self.data):
-            if type(data) is tuple:
-                self.data[i] = PGroup(data)
-            elif type(data) is list:
-                self.data[i] = Pattern(data)
-            elif type(data) is str and len(data) > 1:
-                self.data[i] = Pattern(data)
+        if not is_numeric(self.data):
+            for i, data in enumerate(self.data):
+                if type(data) is tuple:
+                    self.data[i] = PGroup(data)
+                elif type(data) is list:
+                    self.data[i] = Pattern(data)
+                elif type(data) is str and len(data) > 1:
+                    self.data[i] = Pattern(data)
 
         self.data = list(self.data)
                 
@@ -698,6 +801,128 @@ class PatternContainer(metaPattern):
         return str(self)
 
 
+class LazyPattern(Pattern):
+    """
+        The result of an arithmetic operation between Patterns that works out
+        each value when it is indexed instead of storing all of them. This
+        means combining Patterns whose lengths have a large lowest common
+        multiple only uses memory for the values that are used. Operands that
+        are also LazyPatterns are evaluated in the same way.
+
+        Each value is stored once calculated unless `memoize` is False and the
+        value is a number. Using `data` directly, including changing values in
+        place, creates every value and makes it an ordinary Pattern.
+    """
+
+    memoize = True
+
+    # Is None once the values have been stored in `data`
+    operation = None
+
+    @classmethod
+    def operation_of(cls, func, a, b):
+        """ Returns a LazyPattern of func(a[i], b[i]) for Patterns a and b """
+        new = cls.__new__(cls)
+        new.operation = func
+        new.operands  = (new.getter(a), new.getter(b))
+        new.size  = LCM(new.operand_size(a), new.operand_size(b))
+        new.cache = {}
+        return new
+
+    @staticmethod
+    def pending(pat):
+        """ Returns True if `pat` is a LazyPattern whose values aren't stored """
+        return isinstance(pat, LazyPattern) and pat.operation is not None
+
+    @staticmethod
+    def supports(*patterns):
+        """ Returns True if the operands are Patterns (or LazyPatterns) without
+            any nested Patterns or empty items """
+        for pat in patterns:
+            if LazyPattern.pending(pat):
+                continue
+            if type(pat) not in (Pattern, LazyPattern) or len(pat.data) == 0:
+                return False
+            for item in pat.data:
+                if isinstance(item, (metaPattern, EmptyItem)):
+                    return False
+        return True
+
+    @staticmethod
+    def getter(pat):
+        if LazyPattern.pending(pat):
+            # Use a copy so that later changes to `pat` aren't seen, as with `data`
+            node = LazyPattern.__new__(LazyPattern)
+            node.__dict__.update(pat.__dict__)
+            return lambda i: node.item(i % node.size)
+        data = list(pat.data)
+        return lambda i: data[i % len(data)]
+
+    @staticmethod
+    def operand_size(pat):
+        if LazyPattern.pending(pat):
+            return pat.size
+        return len(pat.data)
+
+    def get_data(self):
+        # Once every value is stored the LazyPattern behaves like a Pattern
+        # so that changes made to `data` are used when it is indexed
+        if "data" not in self.__dict__:
+            self.set_data([self.item(i) for i in range(self.size)])
+        return self.__dict__["data"]
+
+    def set_data(self, data):
+        self.__dict__["data"] = data
+        self.operation = None
+        self.operands  = None
+        self.cache = {}
+
+    data = property(get_data, set_data)
+
+    def item(self, i):
+        """ Returns the value at index i, which must be less than the size """
+        if i in self.cache:
+            return self.cache[i]
+        a, b = self.operands
+        try:
+            value = self.operation(a(i), b(i))
+        except ZeroDivisionError:
+            value = 0
+        # Values that aren't numbers may keep state, such as GeneratorPatterns
+        if self.memoize or type(value) not in (int, long, float):
+            self.cache[i] = value
+        return value
+
+    def evaluate(self):
+        """ Returns a Pattern containing every value """
+        new = Pattern()
+        new.data = self.data
+        return new
+
+    def __len__(self):
+        if self.operation is None:
+            return Pattern.__len__(self)
+        return self.size
+
+    def getitem(self, key):
+        if self.operation is None or not isinstance(key, (int, long)):
+            return Pattern.getitem(self, key)
+        val = self.item(key % self.size)
+        if isinstance(val, GeneratorPattern):
+            val = val.getitem()
+        return val
+
+    def __str__(self):
+        if self.operation is None or self.size <= 20:
+            return Pattern.__str__(self)
+        val = [self.item(i) for i in range(8)] + [dots()] + [self.item(i) for i in range(self.size - 8, self.size)]
+        return "P" + self.bracket_style[:-1] + ( repr(val)[1:-1] ) + self.bracket_style[-1]
+
+    def __eq__(self, other):
+        return PEq(self.evaluate(), other.evaluate() if isinstance(other, LazyPattern) else other)
+    def __ne__(self, other):
+        return PNe(self.evaluate(), other.evaluate() if isinstance(other, LazyPattern) else other)
+
 class PGroup(metaPattern):
     """
         Class to represent any groupings of notes as denoted by brackets.
@@ -732,6 +957,36 @@ class PGroup(metaPattern):
 
             self.data = new_data
 
+    def group_table(self):
+        """ Returns a list of the values group_modi() returns for each index,
+            or None if the PGroup contains anything other than constants and
+            PGroups """
+        data, changes, table = self.group_cache
+        if data is self.data and changes == metaPattern.changes:
+            return table
+        table = self.make_group_table()
+        self.group_cache = (self.data, metaPattern.changes, table)
+        return table
+
+    def make_group_table(self):
+        if type(self.data) is not list or len(self.data) == 0:
+            return None
+        lengths = [1]
+        for item in self.data:
+            if isinstance(item, PGroup):
+                values = item.group_table()
+                if values is None:
+                    return None
+                lengths.append(len(values))
+            elif not isinstance(item, (int, long, float, str, bool)):
+                return None
+        size  = len(self.data)
+        depth = pattern_depth(self)
+        period = size * depth * LCM(*lengths)
+        if period > self.flat_size:
+            return None
+        return [group_modi(self.data[key % size], (key // size) // depth) for key in range(period)]
+
     def force_values(self):
         """ Recursively (in place) forces changeable values into non-changeable """
         data = []
@@ -827,7 +1082,7 @@ class EmptyItem(object):
 
 # Used to force any non-pattern data into a Pattern
 
-PATTERN_WEIGHTS = [Pattern, PGroupPrime, PGroup]
+PATTERN_WEIGHTS = [Pattern, LazyPattern, PGroupPrime, PGroup]
 
 PatternType = (Pattern, list)
 
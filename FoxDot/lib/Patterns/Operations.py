@@ -1,5 +1,6 @@
 from __future__ import division
 from utils import *
+import operator
 import Main
 import PlayString
 
@@ -9,10 +10,16 @@ import PlayString
 
 class POperand:
 
-    def __init__(self, func):
+    def __init__(self, func, op=None, swap=False):
         
         self.operate = func
 
+        # Equivalent built-in operator used for flat numeric Patterns, with
+        # its operands swapped for the reversed operations
+
+        self.op   = op
+        self.swap = swap
+
     def __call__(self, A, B):
         """ A is always a Pattern or PGroup.
         """
@@ -23,6 +30,29 @@ class POperand:
 
             return Main.Pattern(B)
 
+        # Work out values when they're used, see Main.LazyPattern. Results
+        # using a LazyPattern are only lazy if they would be too long to store
+
+        if Main.Pattern.lazy or Main.LazyPattern.pending(A) or Main.LazyPattern.pending(B):
+
+            lazy_b = B if isinstance(B, Main.metaPattern) else Main.Pattern(B)
+
+            if Main.LazyPattern.supports(A, lazy_b):
+
+                size = LCM(Main.LazyPattern.operand_size(A), Main.LazyPattern.operand_size(lazy_b))
+
+                if Main.Pattern.lazy or size > Main.Pattern.lazy_size:
+
+                    return Main.LazyPattern.operation_of(self.operate, A, lazy_b)
+
+        if isinstance(A, Main.LazyPattern):
+
+            A = A.evaluate()
+
+        if isinstance(B, Main.LazyPattern):
+
+            B = B.evaluate()
+
         # Get the dominant pattern type and convert B
 
         cls, key = Main.Dominant(A, B)
@@ -36,6 +66,27 @@ class POperand:
 
         i, length = 0, LCM(len(A.data), len(B.data))
 
+        # Don't store every value of very long results
+
+        if length > Main.Pattern.lazy_size and Main.LazyPattern.supports(A, B):
+
+            return Main.LazyPattern.operation_of(self.operate, A, B)
+
+        # Numbers can be combined in one pass without indexing each Pattern
+
+        if self.op is not None and is_numeric(A.data) and is_numeric(B.data):
+
+            a = A.data * (length // len(A.data))
+            b = B.data * (length // len(B.data))
+
+            try:
+
+                return key.true_copy(map(self.op, b, a) if self.swap else map(self.op, a, b))
+
+            except ZeroDivisionError:
+
+                pass
+
         P1 = []
 
         while i < length:
@@ -79,21 +130,21 @@ def rXor(a, b): return b ^ a
 def rOr(a, b):  return b | a
 
 # Pattern operations
-PAdd = POperand(Add)
+PAdd = POperand(Add, operator.add)
 
-PSub = POperand(Sub)
-PSub2 = POperand(rSub)
+PSub = POperand(Sub, operator.sub)
+PSub2 = POperand(rSub, operator.sub, swap=True)
 
-PMul = POperand(Mul)
+PMul = POperand(Mul, operator.mul)
 
-PDiv = POperand(Div)
-PDiv2 = POperand(rDiv)
+PDiv = POperand(Div, operator.truediv)
+PDiv2 = POperand(rDiv, operator.truediv, swap=True)
 
-PMod = POperand(Mod)
-PMod2 = POperand(rMod)
+PMod = POperand(Mod, operator.mod)
+PMod2 = POperand(rMod, operator.mod, swap=True)
 
-PPow = POperand(Pow)
-PPow2 = POperand(rPow)
+PPow = POperand(Pow, operator.pow)
+PPow2 = POperand(rPow, operator.pow, swap=True)
 
 PGet = POperand(Get)
 
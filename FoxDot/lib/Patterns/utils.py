@@ -41,6 +41,12 @@ def sliceToRange(s):
     except OverflowError:
         raise TypeError("range() integer end argument expected, got NoneType")
 
+def GCD(a, b):
+    """ Greatest Common Divisor using Euclid's algorithm """
+    while b:
+        a, b = b, a % b
+    return a
+
 def LCM(*args):
     """ Lowest Common Multiple """
 
@@ -49,18 +55,14 @@ def LCM(*args):
     # Base case
     if len(args) == 0:
         return 1
-    
-    elif len(args) == 1:
-        return args[0]
 
-    X = list(args)
-    
-    while any([X[0]!=K for K in X]):
+    X = args[0]
 
-        i = X.index(min(X))
-        X[i] += args[i]        
+    for n in args[1:]:
 
-    return X[0]
+        X = (X // GCD(X, n)) * n
+
+    return X
 
 def EuclidsAlgorithm(n, k):
     
@@ -85,6 +87,12 @@ def EuclidsAlgorithm(n, k):
     return [x for y in data for x in y]
 
 
+NumberTypes = frozenset((int, long, float))
+
+def is_numeric(data):
+    """ Returns True if data is a non-empty list of only ints and floats """
+    return len(data) > 0 and NumberTypes.issuperset(map(type, data))
+
 def modi(array, i, debug=0):
     """ Returns the modulo index i.e. modi([0,1,2],4) will return 1 """
     try:
@@ -106,6 +114,10 @@ def group_modi(pgroup, index):
     """ Returns value from pgroup that modular indexes nested groups """
     if isinstance(pgroup, (int, float, str, bool)):
         return pgroup
+    if isinstance(pgroup, Main.PGroup):
+        table = pgroup.group_table()
+        if table is not None:
+            return table[index % len(table)]
     try:
         sub_index = index // len(pgroup)
         mod_index = int(sub_index / pattern_depth(pgroup))
@@ -184,6 +184,10 @@ class Player(Repeatable):
     fx_attributes = FxList.all_kwargs()
     fx_keys       = FxList.kwargs()
 
+    # Attribute values of these types never change between events
+
+    constant_types = (int, long, float, str, unicode)
+
     metro   = None
     server  = None
     samples = None
@@ -232,12 +236,22 @@ class Player(Repeatable):
         self.event_n = 0
         self.notes_played = 0
         self.event = {}
+        self.event_plan = None
 
         # Used for checking clock updates
 
         self.current_dur = None
         self.old_pattern_dur = None
         self.old_dur = None
+
+        # Counts the number of times each attribute has been set
+
+        self.versions = {}
+        self.rhythm_version = None
+        self.rhythm_pattern = None
+        self.rhythm_timevars = []
+        self.rhythm_offsets = None
+        self.message_key_cache = None
         
         self.isplaying = False
         self.isAlive = True
@@ -296,6 +310,8 @@ class Player(Repeatable):
                 
                 self.attr[name] = value
 
+                self.attr_updated(name)
+
                 # keep track of what values we change with +-
 
                 if (self.synthdef == SamplePlayer and name == "sample") or (self.synthdef != SamplePlayer and name == "degree"):
@@ -333,6 +349,8 @@ class Player(Repeatable):
     def reset(self):
         """ Sets all Player attributes to 0 unless their default is specified by an effect """
 
+        self.event_plan = None
+
         # Add all keywords to the dict, then set non-zero defaults
 
         for key in Player.Attributes():
@@ -341,6 +359,8 @@ class Player(Repeatable):
 
                 self.attr[key] = asStream(0)
 
+                self.attr_updated(key)
+
                 if key not in self.__dict__:
 
                     self.__dict__[key] = PlayerKey(0, parent=self, attr=key)
@@ -498,28 +518,14 @@ class Player(Repeatable):
             `time` is not specified the function uses self.metro.now(). Setting `event_after`
             to `True` will find the next event *after* `time`"""
 
-        n = 0
-        acc = 0
-        dur = 0
         now = (time if time is not None else self.metro.now())
         bpm = float(self.metro.bpm if self.bpm == None else self.bpm) # TODO: use this to better caclulate event_index -- why?
 
         durations = self.rhythm() if self.current_dur is None else self.current_dur
-        total_dur = float(sum(durations))
-
-        if total_dur == 0:
-
-            WarningMsg("Player object has a total duration of 0. Set to 1")
-
-            durations = [1]
-            total_dur =  1 
-            self.dur  =  1
-    
-        acc = now - (now % total_dur)
 
         try:
 
-            n = int(len(durations) * (acc / total_dur))
+            offsets = self.event_offsets(durations)
 
         except TypeError as e:
 
@@ -529,49 +535,51 @@ class Player(Repeatable):
 
             return 0, 0
 
-        if acc != now:
-
-            while True:
-
-                dur = float(modi(durations, n))
+        if offsets[-1] == 0:
 
-                if acc + dur == now:
-
-                    acc += dur
-
-                    n += 1
+            WarningMsg("Player object has a total duration of 0. Set to 1")
 
-                    break
+            offsets  = cumulative_durations([1])
+            self.dur = 1
 
-                elif acc + dur > now:
+        # Returns value for self.event_n and self.event_index
 
-                    if event_after:
+        return count_events(offsets, now, event_after)
 
-                        acc += dur
-                        n += 1
+    def event_offsets(self, durations):
+        """ Returns the time of each event in one cycle of `durations`, which are
+            only calculated again when the rhythm changes """
+        if self.rhythm_offsets is None or self.rhythm_offsets[0] is not durations:
+            self.rhythm_offsets = (durations, cumulative_durations(durations))
+        return self.rhythm_offsets[1]
 
-                    break
+    def rhythm(self):
+        """ Returns the durations with any TimeVars replaced by their current value. This is
+            only recalculated if `dur` has been set (or replaced in `attr`) or one of its
+            TimeVars has changed value """
 
-                else:
-                    
-                    acc += dur
-                    n += 1
+        durations = self.attr['dur']
+        version   = self.versions.get('dur')
 
-        # Store duration times
+        if version == self.rhythm_version and durations is self.rhythm_pattern and not isinstance(durations, TimeVar.TimeVar):
 
-        # self.old_dur = self.attr['dur']
+            if all(timevar.now() is value for timevar, value in self.rhythm_timevars):
 
-        # Returns value for self.event_n and self.event_index
+                return self.current_dur
 
-        return n, acc
-
-    def rhythm(self):
         rhythm = []
-        for value in self.attr['dur']:
+        timevars = []
+        for value in durations:
             if isinstance(value, TimeVar.TimeVar):
-                rhythm.append(value.now())
+                timevars.append((value, value.now()))
+                rhythm.append(timevars[-1][1])
             else:
                 rhythm.append(value)
+
+        self.rhythm_version  = version
+        self.rhythm_pattern  = durations
+        self.rhythm_timevars = timevars
+
         self.current_dur = asStream(rhythm)
         return self.current_dur
 
@@ -660,10 +668,11 @@ class Player(Repeatable):
 
     def dur_updated(self):
         dur = self.rhythm()
-        if dur != self.old_dur:
-            self.old_dur = dur
-            return True
-        return False
+        if dur is self.old_dur:
+            return False
+        updated = dur != self.old_dur
+        self.old_dur = dur
+        return updated
 
     def step_duration(self):
         return 0.5 if self.synthdef is SamplePlayer else 1
@@ -795,8 +804,10 @@ class Player(Repeatable):
         self.mod_data = data
         if self.synthdef == SamplePlayer:
             self.attr['sample'] = self.modifier + self.mod_data
+            self.attr_updated('sample')
         else:
             self.attr['degree'] = self.modifier + self.mod_data
+            self.attr_updated('degree')
         return self
 
     def __sub__(self, data):
@@ -804,8 +815,10 @@ class Player(Repeatable):
         self.mod_data = 0 - data
         if self.synthdef == SamplePlayer:
             self.attr['sample'] = self.modifier + self.mod_data
+            self.attr_updated('sample')
         else:
             self.attr['degree'] = self.modifier + self.mod_data
+            self.attr_updated('degree')
         return self
 
     def __mul__(self, data):
@@ -859,7 +872,7 @@ class Player(Repeatable):
 
         if isinstance(item, PlayerKey):
             
-            if item.parent in self.queue_block.objects() and item.parent is not self:
+            if item.parent in self.queue_block and item.parent is not self:
 
                 self.queue_block.call(item.parent, self)
 
@@ -884,14 +897,98 @@ class Player(Repeatable):
 
         return attr_value
 
+    def is_constant(self, pattern):
+        """ Returns True if every event uses the same value from `pattern` """
+        if isinstance(pattern, Pattern) and len(pattern) == 1:
+            value = modi(pattern, 0)
+            return value is None or isinstance(value, self.constant_types)
+        return False
+
+    def compile_event(self):
+        """ Splits the attributes into those with the same value for every event, which
+            are stored, and those that need to be calculated for each event """
+
+        self.event_plan = ({}, [], set())
+
+        for key in self.attr:
+
+            self.update_event_plan(key)
+
+        return self.event_plan
+
+    def attr_updated(self, key):
+        """ Records that the value of attribute `key` has been changed """
+
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+        self.update_event_plan(key)
+
+        return
+
+    def update_event_plan(self, key):
+        """ Moves attribute `key` to the constant or the dynamic part of the event plan """
+
+        if self.event_plan is None:
+
+            return
+
+        constants, dynamic, updated = self.event_plan
+
+        if self.is_constant(self.attr[key]):
+
+            constants[key] = modi(self.attr[key], 0)
+
+            updated.add(key)
+
+            if key in dynamic:
+
+                dynamic.remove(key)
+
+        else:
+
+            constants.pop(key, None)
+
+            if key not in dynamic:
+
+                dynamic.append(key)
+
+        return
+
+    def update_player_key(self, key, value):
+        """ Makes sure the object's dict uses PlayerKey instances """
+
+        if key not in self.__dict__:
+
+            self.__dict__[key] = PlayerKey(value, parent=self, attr=key)
+
+        elif not isinstance(self.__dict__[key], PlayerKey):
+
+            self.__dict__[key] = PlayerKey(value, parent=self, attr=key) 
+
+        else:
+
+            self.__dict__[key].update(value)
+
+        return
+
     def get_event(self):
         """ Returns a dictionary of attr -> now values """
 
-        attributes = copy(self.attr)
+        constants, dynamic, updated = self.event_plan if self.event_plan is not None else self.compile_event()
+
+        self.event = constants.copy()
+
+        # Only constant values that have changed need their PlayerKey updating
+
+        while updated:
+
+            key = updated.pop()
+
+            self.update_player_key(key, constants[key])
 
         prime_funcs = {}
         
-        for key in attributes:
+        for key in dynamic:
 
             value = self.event[key] = self.now(key)
 
@@ -919,19 +1016,7 @@ class Player(Repeatable):
 
                         prime_funcs[name] = [key, value, value.get_behaviour()]
 
-            #  Make sure the object's dict uses PlayerKey instances
-
-            if key not in self.__dict__:
-
-                self.__dict__[key] = PlayerKey(value, parent=self, attr=key)
-
-            elif not isinstance(self.__dict__[key], PlayerKey):
-
-                self.__dict__[key] = PlayerKey(value, parent=self, attr=key) 
-
-            else:
-
-                self.__dict__[key].update(value)
+            self.update_player_key(key, value)
 
         # Add largest PGroupPrime function
 
@@ -946,10 +1031,53 @@ class Player(Repeatable):
         return self
 
 
+    def expand_event(self, size, **kwargs):
+        """ Returns the current event, with any values in kwargs, as a dictionary where
+            groups such as chords are expanded into a list of `size` values """
+
+        values = {}
+
+        for key, value in self.event.items() + kwargs.items():
+
+            if value is None or isinstance(value, (int, long, float, str, bool)):
+
+                values[key] = value
+
+            else:
+
+                values[key] = [group_modi(value, i) for i in range(size)]
+
+        return values
+
+    def message_keys(self):
+        """ Returns the attributes that are sent to SuperCollider as SynthDef arguments.
+            Attributes are never removed so these only change when one is added """
+
+        if self.message_key_cache is None or self.message_key_cache[0] != len(self.attr):
+
+            # Don't use fx keywords or foxdot keywords except "degree"
+
+            keys = [key for key in self.attr if (key not in self.keywords) and (key not in self.fx_attributes or key in self.base_attributes)]
+
+            self.message_key_cache = (len(self.attr), keys, [key for key in self.fx_keys if key in self.attr])
+
+        return self.message_key_cache
+
     def osc_message(self, index=0, **kwargs):
         """ Creates an OSC packet to play a SynthDef in SuperCollider,
             use kwargs to force values in the packet, e.g. pan=1 will force ['pan', 1] """
 
+        return self.compile_osc_message(self.expand_event(index + 1, **kwargs), index, kwargs.get("scale", self.scale))
+
+    def compile_osc_message(self, values, index, scale, notes=None):
+        """ Creates the OSC packet for message `index` from a dictionary returned by
+            `expand_event`. Midinotes are stored in `notes` so that any repeated in a
+            chord are only calculated once """
+
+        def get(key):
+            value = values[key]
+            return value[index] if type(value) is list else value
+
         message = {}
         fx_dict = {}
 
@@ -957,8 +1085,8 @@ class Player(Repeatable):
 
         if self.synthdef == SamplePlayer:
 
-            degree = group_modi(kwargs.get("degree", self.event['degree']), index)
-            sample = group_modi(kwargs.get("sample", self.event["sample"]), index)
+            degree = get("degree")
+            sample = get("sample")
 
             buf  = int(self.samples[str(degree)].bufnum(sample))
             
@@ -966,10 +1094,10 @@ class Player(Repeatable):
 
         elif self.synthdef == LoopPlayer:
 
-            pos = group_modi(kwargs.get("degree", self.event["degree"]), index)
-            # sus = group_modi(kwargs.get("dur", self.event["dur"]), index)
+            pos = get("degree")
+            # sus = get("dur")
 
-            buf = group_modi(kwargs.get("buf", self.event["buf"]), index)
+            buf = get("buf")
 
             # Work out the position from the rhythm
 
@@ -997,53 +1125,59 @@ class Player(Repeatable):
 
         else:
 
-            degree = group_modi(kwargs.get("degree", self.event["degree"]), index)
-            octave = group_modi(kwargs.get("oct", self.event["oct"]), index)
-            root   = group_modi(kwargs.get("root", self.event["root"]), index)
+            degree = get("degree")
+            octave = get("oct")
+            root   = get("root")
 
-            midinote = midi( kwargs.get("scale", self.scale), octave, degree, root )
+            try:
 
-            freq   = miditofreq(midinote)
-            
-            message = {'freq':  freq, 'midinote': midinote}
+                note = (float(octave), float(degree), float(root))
 
-        attributes = self.attr.copy()
+            except (TypeError, ValueError):
 
-        # Go through the attr dictionary and add kwargs
+                note = None
 
-        for key in attributes:
+            if notes is not None and note in notes:
 
-            try:
+                midinote, freq = notes[note]
 
-                # Don't use fx keywords or foxdot keywords except "degree"
+            else:
 
-                if (key not in self.keywords) and (key not in self.fx_attributes or key in self.base_attributes):
+                midinote = midi( scale, octave, degree, root )
 
-                    group_value = kwargs.get(key, self.event[key])
+                freq = miditofreq(midinote)
 
-                    val = float(group_modi(group_value, index))
+                if notes is not None and note is not None:
 
-                    ## DEBUG
+                    notes[note] = (midinote, freq)
+            
+            message = {'freq':  freq, 'midinote': midinote}
 
-                    if isinstance(val, (Pattern, PGroup)):
+        _, message_keys, fx_keys = self.message_keys()
+
+        # Go through the attr dictionary and add kwargs
+
+        for key in message_keys:
+
+            try:
 
-                        print "In osc_message:", key, group_value, self.event[key], val
+                val = float(get(key))
 
-                    # Special case modulation
+                # Special case modulation
 
-                    if key == "sus":
+                if key == "sus":
 
-                        val = val * float(self.metro.beat_dur()) * float(group_modi(kwargs.get('blur', self.event['blur']), index))
+                    val = val * float(self.metro.beat_dur()) * float(get('blur'))
 
-                    elif key == "amp":
+                elif key == "amp":
 
-                        val = val * float(group_modi(kwargs.get('amplify', self.event['amplify']), index))
+                    val = val * float(get('amplify'))
 
-                    # Only send non-zero values
+                # Only send non-zero values
 
-                    if val != 0 or key in ("sus", "amp"):
+                if val != 0 or key in ("sus", "amp"):
 
-                        message[key] = val
+                    message[key] = val
 
             except KeyError as e:
 
@@ -1051,49 +1185,47 @@ class Player(Repeatable):
 
         # See if any fx_attributes 
 
-        for key in self.fx_keys:
+        for key in fx_keys:
 
-            if key in attributes: 
+            # Only use effects where the "title" effect value is not 0
 
-                # Only use effects where the "title" effect value is not 0
+            val = get(key)
 
-                val = group_modi(kwargs.get(key, self.event[key]), index)
+            if val != 0:
 
-                if val != 0:
+                fx_dict[key] = []
 
-                    fx_dict[key] = []
+                # Look for any other attributes require e.g. room and verb
 
-                    # Look for any other attributes require e.g. room and verb
+                for n, sub_key in enumerate(FxList[key].args):
 
-                    for n, sub_key in enumerate(FxList[key].args):
+                    if sub_key in self.event:
 
-                        if sub_key in self.event:
+                        # If the sub_key is another attribute like sus, get it from the message
 
-                            # If the sub_key is another attribute like sus, get it from the message
+                        if sub_key in message:
 
-                            if sub_key in message:
+                            val = message[sub_key]
 
-                                val = message[sub_key]
+                        # Get the value from the event
 
-                            # Get the value from the event
+                        else:
 
-                            else:
+                            try:
 
-                                try:
+                                val = get(sub_key)
 
-                                    val = group_modi(kwargs.get(sub_key, self.event[sub_key]), index)
+                            except TypeError as e:
 
-                                except TypeError as e:
+                                val = 0
 
-                                    val = 0
+                            except KeyError as e:
 
-                                except KeyError as e:
+                                del fx_dict[key]
 
-                                    del fx_dict[key]
+                                break
 
-                                    break
-
-                            fx_dict[key] += [sub_key, val]
+                        fx_dict[key] += [sub_key, val]
 
         return message, fx_dict
 
@@ -1105,22 +1237,25 @@ class Player(Repeatable):
         timestamp = kwargs.get("timestamp", self.queue_block.time)
 
         size  = self.largest_attribute() * pattern_depth(self.event.values())
+
+        # Expand any groups in the event once rather than for every message
+
+        values = self.expand_event(size, **kwargs)
+        scale  = kwargs.get("scale", self.scale)
+        notes  = {}
         
         banged = False
 
-        sent_messages = []
-        delayed_messages = []
+        sent_messages = set()
 
         freq = []
         bufnum = []
 
-        last_msg = None
-
         for i in range(size):
 
             # Get the basic osc_msg
 
-            osc_msg, effects = self.osc_message(i, **kwargs)
+            osc_msg, effects = self.compile_osc_message(values, i, scale, notes)
 
             if "freq" in osc_msg:
 
@@ -1132,7 +1267,9 @@ class Player(Repeatable):
 
             # Look at delays and schedule events later if need be
 
-            delay = float(group_modi(kwargs.get('delay', self.event.get('delay', 0)), i))
+            delay = values.get('delay', 0)
+
+            delay = float(delay[i] if type(delay) is list else delay)
 
             if 'buf' in osc_msg:
                     
@@ -1154,13 +1291,13 @@ class Player(Repeatable):
 
                 synthdef = self.get_synth_name(buf)
 
-                key = (osc_msg, effects, delay)
+                key = (tuple(sorted(osc_msg.items())), tuple((name, tuple(args)) for name, args in sorted(effects.items())), delay)
 
                 if key not in sent_messages:
 
                     # Keep note of what messages we are sending
 
-                    sent_messages.append(key)
+                    sent_messages.add(key)
 
                     # Compile the message with time tag
 
@@ -1306,6 +1443,7 @@ class Player(Repeatable):
         for attr in self.attr:
             try:
                 self.attr[attr] = self.attr[attr].pivot(self.event_n)
+                self.attr_updated(attr)
             except AttributeError:
                 pass
         return self
@@ -1350,6 +1488,7 @@ class Player(Repeatable):
 
     def multiply(self, n=2):
         self.attr['degree'] = self.attr['degree'] * n
+        self.attr_updated('degree')
         return self
 
     def degrade(self, amount=0.5):
@@ -1386,6 +1525,8 @@ class Player(Repeatable):
 
         self.attr['delay'] += (dur-self.offset)
 
+        self.attr_updated('delay')
+
         self.offset = dur
 
         return self
@@ -1459,7 +1600,9 @@ class PlayerKey(object):
         self.value = asStream(value)
 
     def update_pattern(self):
-        self.pattern[:] = asStream(self.parent.attr[self.key])               
+        # Replace rather than change the old Pattern, which may still be used
+        # elsewhere, so that Patterns don't need to recalculate their lengths
+        self.pattern = asStream(self.parent.attr[self.key])
         return
 
     def child(self, other):
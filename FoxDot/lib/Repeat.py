@@ -3,6 +3,46 @@
 from Code import WarningMsg
 from Patterns import asStream, modi
 
+from bisect import bisect_left
+from fractions import Fraction
+
+def cumulative_durations(durations):
+    """ Returns the time of each event in one cycle of `durations`, relative to
+        the start of the cycle, followed by the total duration. The sums are
+        exact before rounding so they do not drift like repeated float adds """
+    offsets = [0.0]
+    total = Fraction(0)
+    for i in range(len(durations)):
+        total += Fraction(float(modi(durations, i)))
+        offsets.append(float(total))
+    return offsets
+
+def count_events(offsets, now, event_after=False):
+    """ Uses `offsets`, as returned by `cumulative_durations`, to find the number of
+        events that take place between 0 and `now` and the time of the last event.
+        Setting `event_after` to `True` will find the next event *after* `now` """
+
+    total_dur = offsets[-1]
+
+    acc = now - (now % total_dur)
+
+    n = (len(offsets) - 1) * int(round(acc / total_dur))
+
+    # Find the first event at or after now in this cycle, allowing for
+    # rounding errors in `now - acc` when checking for an event *at* now
+
+    now = now - acc
+
+    i = min(bisect_left(offsets, now - 1e-9), len(offsets) - 1)
+
+    if abs(offsets[i] - now) > 1e-9 and not event_after:
+
+        i -= 1
+
+    n   += i
+    acc += offsets[i]
+
+    return n, acc
         
 
 class Repeatable(object):
@@ -67,7 +107,9 @@ class Repeatable(object):
 
                 sub_method = lambda *args, **kwargs: getattr(self.attr[attr[0]], attr[1]).__call__(*args, **kwargs)
 
-                method = lambda *args, **kwargs: self.attr.update({attr[0]: sub_method(*args, **kwargs)})
+                # Set the attribute so that the Player knows it has changed
+
+                method = lambda *args, **kwargs: setattr(self, attr[0], sub_method(*args, **kwargs))
 
             assert callable(method)
 
@@ -123,6 +165,8 @@ class MethodCall:
 
         self.this_when = self.when[0]
         self.last_when = 0
+
+        self.offsets = None
         
         self.i, self.next = self.count()
 
@@ -134,52 +178,20 @@ class MethodCall:
     def count(self):
         """ Counts the number of times this method would have been called between clock start and now """
 
-        n = 0
-        acc = 0
-        dur = 0
         now = float(self.parent.metro.now())
 
-        # Get durations
+        # Get the time of each call in a cycle, only calculating them again if `when` or `cycle` change
 
-        durations = self.when if self.cycle is None else asStream(self.cycle)
-        total_dur = float(sum(durations))
+        if self.offsets is None or self.offsets[0] is not self.when or self.offsets[1] is not self.cycle:
 
-        # How much time left to fit remainder in
-    
-        acc = now - (now % total_dur)
+            durations = self.when if self.cycle is None else asStream(self.cycle)
+
+            self.offsets = (self.when, self.cycle, cumulative_durations(durations))
 
         # n is the index to return for calculating self.when[n]
         # acc is when to start
 
-        n = int(len(durations) * (acc / total_dur))
-
-        if acc != now:
-
-            while True:
-
-                dur = float(modi(durations, n))
-
-                if acc + dur == now:
-
-                    acc += dur
-
-                    n += 1
-
-                    break
-
-                elif acc + dur > now:
-
-                    acc += dur
-                    n += 1
-
-                    break
-
-                else:
-                    
-                    acc += dur
-                    n += 1
-
-        return n, acc
+        return count_events(self.offsets[2], now, event_after=True)
 
     def __repr__(self):
         return "<Future {}() call of '{}' player>".format(self.method.__name__, self.parent.synthdef)
@@ -8,6 +8,9 @@
 import os, socket
 import signal
 import subprocess 
+import threading
+from collections import deque
+from heapq import heappush, heappop
 from time import sleep
 from Settings import *
 from OSC import *
@@ -20,6 +23,314 @@ class SCLangClient(OSCClient):
         except Exception as e:
             print(e)
 
+    def sendBatch(*args, **kwargs):
+        try:
+            OSCClient.sendBatch(*args, **kwargs)
+        except Exception as e:
+            print(e)
+
+class OSCRecorder(object):
+    """ Stands in for an OSCClient and keeps every message that is sent
+        to it, e.g. when using Clock.render() """
+    def __init__(self):
+        self.messages = []
+
+    def __len__(self):
+        return len(self.messages)
+
+    def send(self, msg, timeout=None):
+        self.messages.append(msg)
+        return
+
+    def close(self):
+        return
+
+class NRTScore(OSCRecorder):
+    """ Writes the messages sent to it to a binary score file that can be
+        rendered by SuperCollider in Non-Realtime mode, e.g.
+
+        `scsynth -N score.osc _ out.aiff 44100 AIFF int16`
+
+        Bundle timestamps are used as seconds from the start of the score
+        and messages are written in time order when the score is closed.
+        The SynthDefs used must also be loaded by the score or scsynth """
+
+    def __init__(self, filename):
+        OSCRecorder.__init__(self)
+        self.filename = filename
+
+    @staticmethod
+    def timetag(seconds):
+        """ Returns `seconds` as a 64-bit fixed point OSC time tag """
+        fract, secs = math.modf(max(seconds, 0))
+        return struct.pack(">LL", long(secs), long(fract * NTP_units_per_second))
+
+    def close(self, duration=None):
+        """ Writes the score file. A final bundle at `duration` seconds (or
+            the last timestamp) tells scsynth when to stop rendering """
+
+        items = []
+
+        for i, msg in enumerate(self.messages):
+
+            if isinstance(msg, OSCBundle):
+
+                seconds = msg.timetag
+
+            else:
+
+                seconds = 0
+
+                bundle = OSCBundle()
+                bundle.append(msg)
+                msg = bundle
+
+            binary = msg.getBinary()
+
+            # Replace the absolute time tag after "#bundle"
+
+            items.append((seconds, i, binary[:8] + self.timetag(seconds) + binary[16:]))
+
+        items.sort()
+
+        end = OSCBundle()
+        end.append(OSCMessage("/c_set", [0, 0]))
+        end = end.getBinary()
+
+        last = max([0] + [item[0] for item in items])
+
+        if duration is not None:
+
+            last = max(last, duration)
+
+        items.append((last, len(items), end[:8] + self.timetag(last) + end[16:]))
+
+        with open(self.filename, "wb") as score:
+
+            for seconds, i, binary in items:
+
+                score.write(struct.pack(">i", len(binary)) + binary)
+
+        return
+
+class BundleTemplate(object):
+    """ The binary layout of an OSC bundle whose messages' arguments are strings,
+        ints and floats. Addresses, type tags and strings are encoded once, so
+        only the numbers need packing to create each new bundle """
+
+    tags = dict([(t, ('f',)) for t in FloatTypes] + [(t, ('i',)) for t in IntTypes])
+
+    def __init__(self, messages):
+        """ `messages` is a list of (address, arguments) pairs where each argument is
+            a string, or ('i',) or ('f',) for where an int or float will be packed """
+
+        fmt    = ">"
+        values = []
+        chunk  = ""
+
+        for address, args in messages:
+
+            tags = "," + "".join("s" if type(arg) is str else arg[0] for arg in args)
+
+            body = [OSCString(arg) if type(arg) is str else arg[0] for arg in args]
+
+            binary = OSCString(address) + OSCString(tags)
+
+            # Each message is a blob prefixed by its size in bytes, strings are
+            # at least 4 bytes long and numbers are a single format character
+
+            size = len(binary) + sum(len(arg) if len(arg) > 1 else 4 for arg in body)
+
+            chunk += struct.pack(">i", size) + binary
+
+            for arg in body:
+
+                if len(arg) > 1:
+
+                    chunk += arg
+
+                else:
+
+                    if chunk:
+
+                        fmt += "%ds" % len(chunk)
+                        values.append(chunk)
+                        chunk = ""
+
+                    fmt += arg
+                    values.append(None)
+
+        if chunk:
+
+            fmt += "%ds" % len(chunk)
+            values.append(chunk)
+
+        self.struct   = struct.Struct(fmt)
+        self.values   = values
+        self.slots    = [i for i, value in enumerate(values) if value is None]
+        self.typetags = "," + "b" * len(messages)
+
+    def bundle(self, numbers, timestamp=0):
+        """ Returns an OSCBundle using `numbers` for each int or float argument """
+        values = list(self.values)
+        for i, value in zip(self.slots, numbers):
+            values[i] = value
+        bundle = OSCBundle(time=timestamp)
+        bundle.message  = self.struct.pack(*values)
+        bundle.typetags = self.typetags
+        return bundle
+
+class OSCSender(object):
+    """ Sends packets to OSC clients from its own thread so that a slow or
+        full socket doesn't hold up the thread that created them. At most
+        `size` packets are kept waiting and the oldest is dropped when a new
+        packet arrives and there is no room left. If given, `on_send` is
+        called with each list of messages just before they are sent """
+    def __init__(self, size=1024, on_send=None):
+        self.on_send = on_send
+        self.packets = deque(maxlen=size)
+        self.ready   = threading.Condition()
+        self.sent    = 0
+        self.dropped = 0
+        self.thread  = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __repr__(self):
+        return "<OSCSender depth={} sent={} dropped={}>".format(self.depth(), self.sent, self.dropped)
+
+    def depth(self):
+        """ Returns the number of packets waiting to be sent """
+        return len(self.packets)
+
+    def put(self, client, msgs):
+        """ Adds the list of messages, `msgs`, to the packets that `client` will send """
+        with self.ready:
+            self.dropped += max(0, len(self.packets) + len(msgs) - self.packets.maxlen)
+            self.packets.extend((client, msg) for msg in msgs)
+            self.ready.notify()
+        return
+
+    def stop(self, timeout=None):
+        """ Sends the packets already waiting then stops the sending thread """
+        with self.ready:
+            if len(self.packets) == self.packets.maxlen:
+                self.dropped += 1
+            self.packets.append((None, None))
+            self.ready.notify()
+        self.thread.join(timeout)
+        return
+
+    def run(self):
+        """ Main loop for the sending thread """
+        running = True
+        while running:
+            with self.ready:
+                while not self.packets:
+                    self.ready.wait()
+                packets = list(self.packets)
+                self.packets.clear()
+            # stop() adds a packet without a client after the last one to send
+            for i, (client, msg) in enumerate(packets):
+                if client is None:
+                    self.dropped += len(packets) - i - 1
+                    packets = packets[:i]
+                    running = False
+                    break
+            # Send each run of packets for the same client together
+            start = 0
+            for i in range(1, len(packets) + 1):
+                if i == len(packets) or packets[i][0] is not packets[start][0]:
+                    msgs = [msg for client, msg in packets[start:i]]
+                    try:
+                        if self.on_send is not None:
+                            self.on_send(msgs)
+                        send_packets(packets[start][0], msgs)
+                    except Exception as e:
+                        print(e)
+                    start = i
+            self.sent += len(packets)
+
+def send_packets(client, msgs):
+    """ Sends a list of messages with `client`, together if it can """
+    if hasattr(client, "sendBatch"):
+        client.sendBatch(msgs)
+    else:
+        for msg in msgs:
+            client.send(msg)
+    return
+
+class IDAllocator(object):
+    """ Hands out ID numbers from `first` up to `last`, in steps of `step`,
+        that are each held until the release time given with them. IDs that
+        have been released are re-used, oldest first, before any new ones.
+        If every ID is held, the ones due to be released first are re-used
+        and counted in `exhausted`. IDs without a release time are never
+        handed out again """
+    def __init__(self, first, last, step=1):
+        self.next = first
+        self.last = last
+        self.step = step
+        self.free = deque()
+        self.held = [] # heap of (release time, (IDs))
+        self.size = 0
+        self.lock = threading.Lock()
+        self.exhausted = 0
+
+    def __repr__(self):
+        return "<IDAllocator held={} free={} exhausted={}>".format(self.size, len(self.free), self.exhausted)
+
+    def __len__(self):
+        """ Returns the number of IDs being held """
+        return self.size
+
+    def release(self, ids):
+        self.free.extend(ids)
+        self.size -= len(ids)
+        return
+
+    def alloc(self, now, release=float("inf"), n=1):
+        """ Returns a list of `n` IDs to be held until `release`, first
+            releasing any IDs held until `now` or earlier. `now` must be a
+            time that no ID allocated later is used before, i.e. not the
+            time of a delayed event """
+        with self.lock:
+            while self.held and self.held[0][0] <= now:
+                self.release(heappop(self.held)[1])
+            if len(self.free) >= n:
+                ids = [self.free.popleft() for i in range(n)]
+            elif not self.free and self.next + (n - 1) * self.step <= self.last:
+                ids = range(self.next, self.next + n * self.step, self.step)
+                self.next += n * self.step
+            else:
+                ids = []
+            while len(ids) < n:
+                if self.free:
+                    ids.append(self.free.popleft())
+                elif self.next <= self.last:
+                    ids.append(self.next)
+                    self.next += self.step
+                elif self.held:
+                    self.release(heappop(self.held)[1])
+                    self.exhausted += 1
+                else:
+                    raise ValueError("Can't allocate more than {} IDs at once".format(len(ids)))
+            if release != float("inf"):
+                heappush(self.held, (release, tuple(ids)))
+                self.size += n
+        return ids
+
+    def reset(self):
+        """ Releases every ID """
+        with self.lock:
+            while self.held:
+                self.release(heappop(self.held)[1])
+        return
+
+# Largest UDP datagram that scsynth (and IPv4) will accept
+
+SCSYNTH_MAX_PACKET_SIZE = 65507
+
 class SCLangServerManager:
 
     metro = None
@@ -41,12 +352,29 @@ class SCLangServerManager:
         self.sclang = SCLangClient()
         self.sclang.connect( (self.addr, self.SCLang_port) )        
 
-        self.node = 1000
-        self.bus  = 4
+        # Node IDs and (stereo) private buses are held by each note until
+        # it has finished playing, see get_bundle()
+        self.nodes, self.buses = self.id_allocators()
+
+        # Those used in real time while rendering, see set_rendering()
+        self.live_ids = None
+
+        # Seconds after a note should have finished before its node IDs
+        # and bus are used again
+        self.release_time = 0.25
 
         self.fx_setup_done = False
         self.fx_names = {}
 
+        self.bundle_templates = {}
+
+        # Bundles sent together are packed into datagrams of up to this
+        # many bytes when greater than 0, see set_packet_size()
+        self.packet_size = 0
+
+        # Sends packets from another thread when set, see set_sender()
+        self.sender = None
+
         # Toggle debug
         # ------------
 
@@ -58,19 +386,43 @@ class SCLangServerManager:
     def __repr__(self):
         return str(self)
 
-    def nextnodeID(self):
-        self.node += 1
-        return self.node
+    def nextnodeID(self, now=0, release=float("inf")):
+        """ Returns a node ID that isn't used again until time `release`, or
+            ever if no release time is given """
+        return self.nodes.alloc(now, release)[0]
 
     def query(self):
         self.client.send(OSCMessage("/status"))
         return
 
-    def nextbusID(self):
-        if self.bus > 102:
-            self.bus = 1
-        self.bus += 1
-        return self.bus
+    @staticmethod
+    def id_allocators():
+        """ Returns new IDAllocators for node IDs and (stereo) private buses """
+        return IDAllocator(1001, 2**31 - 1), IDAllocator(4, 102, step=2)
+
+    def set_rendering(self, rendering=True):
+        """ Gives the messages created by Clock.render(), which are timestamped
+            from 0, their own node IDs and buses starting from the first ones.
+            Those used in real time are put back when `rendering` is False """
+        if rendering and self.live_ids is None:
+            self.live_ids = (self.nodes, self.buses)
+            self.nodes, self.buses = self.id_allocators()
+        elif not rendering and self.live_ids is not None:
+            self.nodes, self.buses = self.live_ids
+            self.live_ids = None
+        return
+
+    def nextbusID(self, now, release):
+        """ Returns the first of two audio buses that aren't used again until
+            time `release` """
+        return self.buses.alloc(now, release)[0]
+
+    def current_time(self):
+        """ Returns the earliest time that a new bundle can be timestamped
+            with, or 0 if there is no clock to ask """
+        if self.metro is None:
+            return 0
+        return self.metro.osc_message_time()
 
     def sendOSC(self, packet):
         """ Compiles and sends an 's_new' OSC message for SuperCollider """
@@ -84,6 +436,8 @@ class SCLangServerManager:
         msg = OSCMessage("/g_freeAll")
         msg.append([1])
         self.client.send(msg)
+        self.nodes.reset()
+        self.buses.reset()
         return
 
     def setFx(self, fx_list):
@@ -104,14 +458,12 @@ class SCLangServerManager:
 
     def get_bundle(self, synthdef, packet, effects, timestamp=0):
 
-        # Create a bundle
-        
-        bundle = OSCBundle(time=timestamp)
-
         # Create a specific message for midi
 
         if synthdef == "MidiOut":
 
+            bundle = OSCBundle(time=timestamp)
+
             bundle.setAddress("/foxdot_midi")
 
             msg = OSCMessage()
@@ -127,32 +479,43 @@ class SCLangServerManager:
 
             return bundle
 
+        # Make sure messages release themselves after 8 * the duration at max (temp)
+        max_sus = float(packet["sus"] * 8)
+
+        # The group (and every node in it) is freed by then so its node IDs
+        # and bus, which effect tails write to until then, can be re-used.
+        # Nodes are needed for the group, startSound, synth, effects and makeSound
+
+        size = 4 + sum(1 for order in (0, 1, 2) for fx in self.fxlist.order[order] if fx in effects)
+
+        # Only release IDs held by notes that finish before any new bundle
+        # can start. Delayed bundles are timestamped later than this
+
+        now = self.current_time()
+
+        release = timestamp + max_sus + self.release_time
+
+        next_node = iter(self.nodes.alloc(now, release, size)).next
+
         # Create a group for the note
-        group_id = self.nextnodeID()
-        msg = OSCMessage("/g_new")
-        msg.append( [group_id, 1, 1] )
-        bundle.append(msg)
+        group_id = next_node()
+        messages = [ ("/g_new", [group_id, 1, 1]) ]
 
         # Get the bus and SynthDef nodes
-        this_bus  = self.nextbusID()
-        this_node = self.nextnodeID()
-
-        # Make sure messages release themselves after 8 * the duration at max (temp)
-        max_sus = float(packet["sus"] * 8)
+        this_bus  = self.nextbusID(now, release)
+        this_node = next_node()
 
         # Effects of order 0 go first - then the synth, then order 1, then envelope (todo) then order 2
 
         # IN
         
-        msg = OSCMessage("/s_new")
         key = "rate" if synthdef in (SamplePlayer, LoopPlayer) else "freq"
         if key in packet:
             value = ["rate", packet[key]]
         else:
             value = []
         osc_packet = ["startSound", this_node, 0, group_id, 'bus', this_bus, "sus", max_sus] + value
-        msg.append( osc_packet )
-        bundle.append(msg)
+        messages.append( ("/s_new", osc_packet) )
 
         # ORDER 0
 
@@ -163,15 +526,11 @@ class SCLangServerManager:
                 this_effect = effects[fx]
 
                 # Get next node ID
-                this_node, last_node = self.nextnodeID(), this_node
-                msg = OSCMessage("/s_new")
+                this_node, last_node = next_node(), this_node
                 osc_packet = [self.fx_names[fx], this_node, 1, group_id, 'bus', this_bus] + this_effect
-                msg.append(osc_packet)
-                bundle.append(msg)
+                messages.append( ("/s_new", osc_packet) )
 
         # SYNTH
-            
-        msg = OSCMessage("/s_new")
 
         for key in packet:
 
@@ -185,10 +544,9 @@ class SCLangServerManager:
                 packet[key] = 0.0
 
         # Get next node ID
-        this_node, last_node = self.nextnodeID(), this_node                
+        this_node, last_node = next_node(), this_node                
         osc_packet = [synthdef, this_node, 1, group_id, 'bus', this_bus] + self.create_osc_msg(packet)        
-        msg.append( osc_packet )
-        bundle.append(msg)
+        messages.append( ("/s_new", osc_packet) )
 
         # ORDER 1
 
@@ -199,11 +557,9 @@ class SCLangServerManager:
                 this_effect = effects[fx]
 
                 # Get next node ID
-                this_node, last_node = self.nextnodeID(), this_node
-                msg = OSCMessage("/s_new")
+                this_node, last_node = next_node(), this_node
                 osc_packet = [self.fx_names[fx], this_node, 1, group_id, 'bus', this_bus] + this_effect
-                msg.append( osc_packet )
-                bundle.append(msg)
+                messages.append( ("/s_new", osc_packet) )
 
         # ENVELOPE (TODO)
 
@@ -216,22 +572,128 @@ class SCLangServerManager:
                 this_effect = effects[fx]
 
                 # Get next node ID
-                this_node, last_node = self.nextnodeID(), this_node
-                msg = OSCMessage("/s_new")
+                this_node, last_node = next_node(), this_node
                 osc_packet = [self.fx_names[fx], this_node, 1, group_id, 'bus', this_bus] + this_effect
-                msg.append( osc_packet )
-                bundle.append(msg)
+                messages.append( ("/s_new", osc_packet) )
 
         # OUT
         
-        msg = OSCMessage("/s_new")
-        this_node, last_node = self.nextnodeID(), this_node
+        this_node, last_node = next_node(), this_node
         osc_packet = ['makeSound', this_node, 1, group_id, 'bus', this_bus, 'sus', max_sus]
-        msg.append( osc_packet )
-
-        bundle.append(msg)
+        messages.append( ("/s_new", osc_packet) )
         
-        return bundle        
+        return self.compile_bundle(messages, timestamp)
+
+    def compile_bundle(self, messages, timestamp=0):
+        """ Creates an OSCBundle from a list of (address, arguments) pairs. The
+            encoded strings and layout are stored for each new combination of
+            string values and argument types and re-used with new numbers """
+
+        try:
+
+            key = tuple((address, tuple(arg if type(arg) is str else BundleTemplate.tags[type(arg)] for arg in args)) for address, args in messages)
+
+        except KeyError:
+
+            # Fall back to encoding each argument for any other types
+
+            bundle = OSCBundle(time=timestamp)
+
+            for address, args in messages:
+
+                msg = OSCMessage(address)
+                msg.append(args)
+                bundle.append(msg)
+
+            return bundle
+
+        if key not in self.bundle_templates:
+
+            self.bundle_templates[key] = BundleTemplate(key)
+
+        numbers = [arg for address, args in messages for arg in args if type(arg) is not str]
+
+        return self.bundle_templates[key].bundle(numbers, timestamp)
+
+    def set_packet_size(self, size=1472):
+        """ Packs bundles with the same timestamp that are sent in the same
+            block into nested bundles of up to `size` bytes so they are sent
+            as fewer datagrams, e.g. 1472 for an ethernet MTU. Sizes larger
+            than scsynth accepts are reduced and 0 turns packing off """
+        self.packet_size = max(0, min(int(size), SCSYNTH_MAX_PACKET_SIZE))
+        return
+
+    def set_sender(self, size=1024):
+        """ Sends the messages created by the Clock from a separate thread
+            that holds up to `size` messages waiting to be sent, so that the
+            clock isn't held up by the network. Use 0 to send them straight
+            away from the clock again. Messages waiting to be sent by the
+            previous thread are sent before it is stopped """
+        sender = self.sender
+        self.sender = OSCSender(int(size), self.on_send) if size > 0 else None
+        if sender is not None:
+            sender.stop()
+        return
+
+    def send_packets(self, client, msgs):
+        """ Sends the list of messages, `msgs`, using `client` via the sending
+            thread if there is one """
+        if self.sender is None:
+            self.on_send(msgs)
+            send_packets(client, msgs)
+        else:
+            self.sender.put(client, msgs)
+        return
+
+    def on_send(self, msgs):
+        """ Is called just before `msgs` are sent to let the Clock measure
+            how early they are """
+        if self.metro is not None:
+            self.metro.sent(msgs)
+        return
+
+    def coalesce(self, messages):
+        """ Returns a list of packets to send in place of `messages` with
+            bundles that share a timestamp nested inside a single bundle
+            of at most `packet_size` bytes. Any bundle too large to share
+            a packet and any other message is returned as it is """
+
+        packets = []
+        groups  = {}
+
+        for msg in messages:
+
+            if not isinstance(msg, OSCBundle) or msg.address == "/foxdot_midi":
+
+                packets.append(msg)
+
+                continue
+
+            binary = msg.getBinary()
+
+            # A nested bundle needs 16 bytes for the outer header and 4 for its size
+
+            if len(binary) + 20 > self.packet_size:
+
+                packets.append(msg)
+
+                continue
+
+            outer, size = groups.get(msg.timetag, (None, 0))
+
+            if outer is None or size + len(binary) + 4 > self.packet_size:
+
+                outer = OSCBundle(time=msg.timetag)
+                size  = 16
+
+                packets.append(outer)
+
+            outer.message  += OSCBlob(binary)
+            outer.typetags += 'b'
+
+            groups[msg.timetag] = (outer, size + len(binary) + 4)
+
+        return packets
 
     def send(self, address, message):
         """ Sends message (a list) to SuperCollider """
@@ -19,7 +19,10 @@ from TimeVar import TimeVar
 from Midi import MidiIn, MIDIDeviceNotFound
 from Patterns.utils import modi
 from time import sleep, time, clock
-from fractions import Fraction
+from heapq import heappush, heappop
+from weakref import WeakKeyDictionary
+from Queue import Queue as JobQueue, Full as JobQueueFull
+from collections import deque
 from traceback import format_exc as error_stack
 import sys
 import threading
@@ -30,7 +33,7 @@ class TempoClock(object):
 
     server = None
 
-    def __init__(self, bpm=120.0, meter=(4,4)):
+    def __init__(self, bpm=120.0, meter=(4,4), ticks_per_beat=20160):
 
         # Flag this when done init
         self.__setup   = False
@@ -40,16 +43,26 @@ class TempoClock(object):
         self.largest_sleep_time = 0
         self.last_block_dur = 0.0
 
-        self.dtype=Fraction
+        # Timing measurements for each block, see Clock.stats()
 
-        # Store time as a rational number
-        
-        self.time = self.dtype(0)
-        self.beat = self.dtype(0)
-        self.start_time = self.dtype(time())
+        self.metrics = ClockMetrics()
+
+        # Store time as a whole number of ticks. The default resolution is
+        # divisible by every number from 1 to 10 so common tuplets are exact
+
+        self.ticks_per_beat = ticks_per_beat
+
+        self.tick = 0
+        self.beat = 0.0
+        self.time = 0.0
+        self.start_time = time()
 
         # Don't start yet...
         self.ticking = False
+        self.thread  = None
+
+        # When rendering offline, time only moves from event to event
+        self.offline = False
 
         # Player Objects stored here
         self.playing = []
@@ -64,6 +77,9 @@ class TempoClock(object):
         # Create the queue
         self.queue = Queue()
         self.current_block = None
+
+        # Threads that execute the blocks popped from the queue
+        self.workers = WorkerPool(self.__run_block, size=1)
         
         # Midi Clock In
         self.midi_clock = None
@@ -73,6 +89,19 @@ class TempoClock(object):
         self.nudge      = 0.0
         self.sleep_time = 0.0001
 
+        # The run loop sleeps until `spin_time` seconds before the next event
+        # (for at most `max_sleep_time` seconds) then polls every `sleep_time`
+        self.spin_time      = 0.002
+        self.max_sleep_time = 0.05
+        self.wake           = threading.Event()
+
+        # Blocks are run up to `lookahead` seconds before they are due and
+        # their messages are timestamped with the time they are due
+        self.lookahead = 0.0
+
+        # Beat of the block being run by each worker thread
+        self.rendering = threading.local()
+
         # Debug
         self.debugging = False
         self.__setup   = True
@@ -141,15 +170,70 @@ class TempoClock(object):
             print("{}: No MIDI devices found".format(e))
         return
 
+    def set_workers(self, n=1):
+        """ Sets the number of threads used to execute queue blocks. Using
+            more than 1 means blocks may no longer complete in order """
+        self.workers.resize(n)
+        return
+
+    def stats(self):
+        """ Returns a dictionary of timing measurements for recent blocks
+            (in seconds) and counts of blocks, bundles and late bundles:
+
+            - `wake`: how long after its scheduled time each block was started by the clock
+            - `block`: how long each block took to run
+            - `headroom`: time between sending each bundle and its timestamp, late if < 0
+
+            The number of node IDs and buses held by notes that are still
+            playing and the number of times a bus was re-used early because
+            they were all in use are also given, as are the number of blocks
+            waiting for a worker thread, started while every worker was busy
+            (`overruns`) and dropped because too many were waiting.
+
+            If messages are sent from a separate thread (see Server.set_sender)
+            the number waiting to be sent and the number dropped are included
+        """
+        stats = self.metrics.as_dict()
+        stats["queue_depth"]    = self.workers.depth()
+        stats["overruns"]       = self.workers.overruns
+        stats["dropped_blocks"] = self.workers.dropped
+        if self.server is not None:
+            stats["nodes_in_use"]    = len(self.server.nodes)
+            stats["buses_in_use"]    = len(self.server.buses)
+            stats["buses_exhausted"] = self.server.buses.exhausted
+        if self.server is not None and self.server.sender is not None:
+            stats["send_queue_depth"] = self.server.sender.depth()
+            stats["send_dropped"]     = self.server.sender.dropped
+        stats["largest_sleep_time"] = self.largest_sleep_time
+        stats["last_block_dur"]     = self.last_block_dur
+        return stats
+
+    def reset_stats(self):
+        """ Clears the measurements returned by Clock.stats() """
+        self.metrics = ClockMetrics()
+        self.workers.overruns = 0
+        self.workers.dropped  = 0
+        self.largest_sleep_time = 0
+        return
+
     def debug(self, on=True):
         self.debugging = bool(on)
         return
 
+    def beats_to_ticks(self, beats):
+        """ Returns the nearest whole number of ticks to a duration in beats """
+        return int(round(beats * self.ticks_per_beat))
+
+    def ticks_to_beats(self, ticks):
+        """ Returns a number of ticks as a duration in beats """
+        return ticks / self.ticks_per_beat
+
     def set_time(self, beat):
         """ Set the clock time to 'beat' and update players in the clock """
         self.start_time = time()
         self.queue.clear()
-        self.beat = beat
+        self.tick = self.beats_to_ticks(beat)
+        self.beat = self.ticks_to_beats(self.tick)
         self.time = time() - self.start_time
         for player in self.playing:
             player(count=True)
@@ -157,39 +241,152 @@ class TempoClock(object):
 
     def true_now(self):
         """ Returns the *actual* elapsed time (in beats) when adjusting for latency etc """
+        if self.offline:
+            return self.beat
         # Get number of seconds elapsed
-        now = self.dtype(((time() - self.start_time) - self.latency) + self.nudge)
-        # Increment the beat counter
-        self.beat += (now - self.time) * (self.dtype(self.get_bpm()) / 60)
-        # Store time
-        self.time  = now
+        now = ((time() - self.start_time) - self.latency) + self.nudge
+        # Increment the tick counter by the whole ticks that have passed
+        tick_dur = 60.0 / (self.get_bpm() * self.ticks_per_beat)
+        ticks = (now - self.time) / tick_dur
+        whole = int(ticks)
+        self.tick += whole
+        self.beat  = self.ticks_to_beats(self.tick)
+        # Store time, keeping hold of any part of a tick left over
+        self.time  = now - ((ticks - whole) * tick_dur)
         return self.beat
 
     def now(self):
-        """ Returns the total elapsed time (in beats as opposed to seconds) """
-        if not self.ticking:
-            self.beat = self.true_now()
-        return self.beat + self.beat_dur(self.latency)
+        """ Returns the total elapsed time (in beats as opposed to seconds). While
+            a queue block is being run ahead of time (see set_lookahead), this
+            is the beat the block is due """
+        beat = getattr(self.rendering, "beat", None) if self.lookahead > 0 else None
+        if beat is None:
+            if not self.ticking:
+                self.beat = self.true_now()
+            beat = self.beat
+        return beat + self.beat_dur(self.latency)
 
     def osc_message_time(self):
         """ Returns the true time that an osc message should be run i.e. now + latency """
+        if self.offline:
+            return self.time
         return time() + self.latency - self.nudge
+
+    def tick_to_time(self, tick):
+        """ Returns the time that an osc message for an event at `tick` should be run """
+        tick_dur = 60.0 / (self.get_bpm() * self.ticks_per_beat)
+        # true_now() keeps the clock this many seconds behind the system time
+        offset = self.latency - self.nudge
+        # System time when the clock will reach `tick`
+        reached = self.start_time + self.time + ((tick - self.tick) * tick_dur) + offset
+        # Then add latency as in osc_message_time()
+        return reached + offset
+
+    def sent(self, messages):
+        """ Is called by the Server just before it sends messages, which may
+            be from a separate thread, to measure how early they are sent """
+        if not self.offline:
+            late = self.metrics.add_sent(messages)
+            if late and self.debugging:
+                Code.WarningMsg("{} bundle(s) sent late at beat {}".format(late, self.beat))
+        return
+
+    def set_lookahead(self, seconds=0.0):
+        """ Runs queue blocks (i.e. calculates Player events and osc messages)
+            up to `seconds` ahead of when they are due so that the time it takes
+            doesn't use up any of the latency. Set to 0 to turn off """
+        self.lookahead = float(seconds)
+        return
         
     def start(self):
         """ Starts the clock thread """
-        main = threading.Thread(target=self.run)
-        main.daemon = True
-        main.start()
+        if self.offline:
+            return
+        # Set before the thread runs so that stopping straight away isn't undone
+        self.ticking = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return
+
+    def render(self, beats, client):
+        """ Runs the next `beats` beats of the queue as fast as possible without
+            waiting for real time to pass. Osc messages are sent to `client`, any
+            object with a `send` method such as an OSCRecorder or NRTScore,
+            instead of SuperCollider and are timestamped in seconds from the
+            start of the render. The clock is stopped while rendering and can
+            be started again with Clock.start() """
+
+        # Stop the real time clock
+
+        self.ticking = False
+        self.wake.set()
+
+        if self.thread is not None and self.thread is not threading.current_thread():
+
+            self.thread.join()
+
+        self.offline = True
+        self.time    = 0.0
+
+        end = self.tick + self.beats_to_ticks(beats)
+
+        # Rendered notes don't share node IDs and buses with real time ones
+
+        if self.server is not None:
+
+            self.server.set_rendering(True)
+
+        try:
+
+            while self.queue.next() <= end:
+
+                self.advance(self.queue.next())
+
+                block = self.queue.pop()
+
+                if len(block):
+
+                    self.__run_block(block, client)
+
+            self.advance(end)
+
+        finally:
+
+            self.offline = False
+
+            if self.server is not None:
+
+                self.server.set_rendering(False)
+
+            # Carry on from this tick when started again
+
+            self.start_time = time()
+            self.time = self.nudge - self.latency
+
+        return
+
+    def advance(self, tick):
+        """ Moves the offline clock forward to `tick` """
+        if tick > self.tick:
+            self.time += (tick - self.tick) * 60.0 / (self.get_bpm() * self.ticks_per_beat)
+            self.tick  = tick
+            self.beat  = self.ticks_to_beats(tick)
         return
 
-    def __run_block(self, block):
+    def __run_block(self, block, client=None):
         """ Private method for calling all the items in the queue block.
             This means the clock can still 'tick' while a large number of
             events are activated  """
 
-        # Set the time to "activate" messages on SC
+        # Set the time to "activate" messages on SC. Blocks run ahead of time
+        # already have a time set but shouldn't be sent in the past
+
+        block.time = max(block.time, self.osc_message_time())
+
+        self.rendering.beat = self.ticks_to_beats(block.tick)
 
-        block.time = self.osc_message_time()
+        start = time()
 
         for item in block:
 
@@ -207,24 +404,32 @@ class TempoClock(object):
 
                     print(error_stack())
 
+        self.rendering.beat = None
+
+        self.last_block_dur = time() - start
+
+        if not self.offline:
+
+            self.metrics.add_block(self.last_block_dur)
+
         # Send all the message to supercollider together
 
-        block.send_osc_messages()
+        block.send_osc_messages(client)
 
         return
 
     def run(self):
         """ Main loop """
-        
-        self.ticking = True
 
         while self.ticking:
 
-            beat = self.true_now() # get current time
+            self.true_now() # get current time
 
             next_event = self.queue.next()
 
-            if beat >= next_event:
+            horizon = self.lookahead_ticks()
+
+            if self.tick + horizon >= next_event:
 
                 self.current_block = self.queue.pop()
 
@@ -232,7 +437,17 @@ class TempoClock(object):
 
                     # print float(self.now()), self.current_block
 
-                    threading.Thread(target=self.__run_block, args=(self.current_block,)).start()
+                    if horizon > 0:
+
+                        self.current_block.time = self.tick_to_time(self.current_block.tick)
+
+                    self.metrics.wake.add(self.beat_dur(self.ticks_to_beats(self.tick - self.current_block.tick)))
+
+                    self.workers.submit(self.current_block)
+
+                # The next block might also be due
+
+                continue
 
             # If using a midi-clock, update the values
 
@@ -240,9 +455,42 @@ class TempoClock(object):
 
                 self.midi_clock.update()
 
-            if self.sleep_time > 0:
+                if self.sleep_time > 0:
+
+                    sleep(self.sleep_time)
 
-                sleep(self.sleep_time)
+            else:
+
+                self.wait(next_event - horizon - self.tick)
+
+        return
+
+    def lookahead_ticks(self):
+        """ Returns the lookahead time as a number of ticks """
+        if self.lookahead > 0:
+            return self.beats_to_ticks(self.seconds_to_beats(self.lookahead))
+        return 0
+
+    def wait(self, ticks):
+        """ Sleeps until `spin_time` seconds before an event that is `ticks`
+            ticks away, or until an earlier event is scheduled, then polls
+            every `sleep_time` seconds so that the event isn't late """
+
+        timeout = min(self.beat_dur(self.ticks_to_beats(ticks)), self.max_sleep_time) - self.spin_time
+
+        if timeout > 0:
+
+            if timeout > self.largest_sleep_time:
+
+                self.largest_sleep_time = timeout
+
+            self.wake.wait(timeout)
+
+            self.wake.clear()
+
+        elif self.sleep_time > 0:
+
+            sleep(self.sleep_time)
 
         return
 
@@ -285,7 +533,15 @@ class TempoClock(object):
 
         # Add to the queue
 
-        self.queue.add(obj, beat, args, kwargs)
+        tick = self.beats_to_ticks(beat)
+
+        self.queue.add(obj, tick, args, kwargs)
+
+        # Wake the clock up if this is now the next event
+
+        if self.queue.next() == tick:
+
+            self.wake.set()
 
         return
 
@@ -296,7 +552,7 @@ class TempoClock(object):
 
     def next_event(self):
         """ Returns the beat index for the next event to be called """
-        return self.queue[-1][1]
+        return self.ticks_to_beats(self.queue.next())
 
     def call(self, obj, dur, args=()):
         """ Returns a 'schedulable' wrapper for any callable object """
@@ -313,12 +569,14 @@ class TempoClock(object):
 
     def stop(self):
         self.ticking = False
+        self.wake.set()
         self.reset()
         return
 
     def shift(self, n):
         """ Offset the clock time """
-        self.beat += n
+        self.tick += self.beats_to_ticks(n)
+        self.beat  = self.ticks_to_beats(self.tick)
         return
 
     def clear(self):
@@ -347,104 +605,135 @@ class TempoClock(object):
 #####
 
 class Queue(object):
+    """ Priority queue of QueueItems. Ticks are stored in a heap so that the
+        next block can be found in constant time and new blocks inserted in
+        O(log n). Events scheduled for the same tick share one QueueItem """
+
+    # Argument names accepted by each scheduled function / class
+    keywords = WeakKeyDictionary()
+
     def __init__(self):
-        self.data = []
+        self.data   = [] # heap of ticks
+        self.blocks = {} # tick -> QueueItem
+        self.lock   = threading.Lock()
 
     def __repr__(self):
-        return "\n".join([str(item) for item in self.data]) if len(self.data) > 0 else "[]"
+        return "\n".join([str(item) for item in self]) if len(self.data) > 0 else "[]"
 
-    def add(self, item, beat, args=(), kwargs={}):
-        """ Adds a callable object to the queue at a specified beat, args and kwargs for the
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        """ Iterates over the QueueItems in the order they will be called """
+        for tick in sorted(self.data):
+            yield self.blocks[tick]
+
+    def add(self, item, tick, args=(), kwargs={}):
+        """ Adds a callable object to the queue at a specified tick, args and kwargs for the
             callable object must be in a list and dict.
         """
         
         # item must be callable to be schedule, so check args and kwargs are appropriate for it
 
-        try:
-
-            function = inspect.getargspec(item)
-
-        except TypeError:
-
-            function = inspect.getargspec(item.__call__)
+        keywords = self.get_keywords(item)
 
         # If the item can't take arbitrary keywords, check any kwargs are valid
 
-        if function.keywords is None: 
+        if keywords is not None: 
 
             for key in list(kwargs.keys()):
 
-                if key not in function.args:
+                if key not in keywords:
 
                     del kwargs[key]
 
-        # If the new event is before the next scheduled event,
-        # move it to the 'front' of the queue
+        with self.lock:
 
-        if beat < self.next():
+            # If another event is happening at the same time, schedule together
 
-            self.data.append(QueueItem(item, beat, args, kwargs))
+            if tick in self.blocks:
 
-            block = self.data[-1]
+                block = self.blocks[tick]
 
-        else:
+                block.add(item, args, kwargs)
+
+            else:
 
-            # If the event is after the next scheduled event, work
-            # out its position in the queue
+                block = self.blocks[tick] = QueueItem(item, tick, args, kwargs)
 
-            # need to be careful in case self.data changes size
-            
-            for block in self.data:
+                heappush(self.data, tick)
 
-                # If another event is happening at the same time, schedule together
+        # Tell any players about what queue item they are in
 
-                if beat == block.beat:
+        if hasattr(item, "queue_block"):
 
-                    block.add(item, args, kwargs)                    
+            item.queue_block = block
 
-                    break
+        return
 
-                # If the event is later than the next event, schedule it here
+    @classmethod
+    def get_keywords(cls, item):
+        """ Returns the set of argument names that `item` accepts, or None if
+            it takes arbitrary keywords. Results are cached by function for
+            functions and methods, and by class for any other callable """
 
-                if beat > block.beat:
+        if isinstance(item, FunctionType):
 
-                    try:
+            key = item
 
-                        i = self.data.index(block)
+        elif isinstance(item, MethodType):
 
-                    except ValueError:
+            key = item.__func__
 
-                        i = 0
+        else:
 
-                    self.data.insert(i, QueueItem(item, beat, args, kwargs))
+            key = item.__class__
 
-                    block = self.data[i]
+        try:
 
-                    break
+            return cls.keywords[key]
 
-        # Tell any players about what queue item they are in
+        except (KeyError, TypeError):
 
-        if hasattr(item, "queue_block"):
+            pass
 
-            item.queue_block = block
+        try:
 
-        return
+            function = inspect.getargspec(item)
+
+        except TypeError:
+
+            function = inspect.getargspec(item.__call__)
+
+        keywords = None if function.keywords is not None else frozenset(function.args)
+
+        try:
+
+            cls.keywords[key] = keywords
+
+        except TypeError:
+
+            pass # Can't be weakly referenced
+
+        return keywords
 
     def clear(self):
-        while len(self.data):
-            del self.data[-1]
+        with self.lock:
+            del self.data[:]
+            self.blocks.clear()
         return
 
     def pop(self):
-        return self.data.pop() if len(self.data) > 0 else list()
+        with self.lock:
+            if len(self.data) > 0:
+                return self.blocks.pop(heappop(self.data))
+        return list()
 
     def next(self):
-        if len(self.data) > 0:
-            try:
-                return self.data[-1].beat
-            except IndexError:
-                pass
-        return sys.maxsize
+        try:
+            return self.data[0]
+        except IndexError:
+            return sys.maxsize
             
 from types import FunctionType
 class QueueItem(object):
@@ -460,22 +749,28 @@ class QueueItem(object):
     def __init__(self, obj, t, args=(), kwargs={}):
 
         self.events         = [ [] for lvl in self.priority_levels ]
-        self.called_events  = []
-        self.called_objects = []
+        self.objs           = {}    # id(obj) -> QueueObj
+        self.called_events  = set() # id(obj) of called objects
 
         self.osc_messages   = []
 
-        self.beat = t
+        self.tick = t
         self.time = 0
         self.add(obj, args, kwargs)
         
     def __repr__(self):
-        return "{}: {}".format(self.beat, list(self))
+        return "{}: {}".format(self.tick, list(self))
     
     def add(self, obj, args=(), kwargs={}):
         """ Adds a callable object to the QueueItem """
 
-        q_obj = QueueObj(obj, args, kwargs)
+        # Only the first scheduled call of an object is used
+
+        if id(obj) in self.objs:
+
+            return
+
+        q_obj = self.objs[id(obj)] = QueueObj(obj, args, kwargs)
 
         for i, level in enumerate(self.priority_levels):
 
@@ -489,61 +784,66 @@ class QueueItem(object):
     def __call__(self):
         self.send_osc_messages()
 
-    def send_osc_messages(self):
-        """ Sends all compiled osc messages to the SuperCollider server """
-        for msg in self.osc_messages:
-            if msg.address == "/foxdot_midi":
-                self.server.sclang.send(msg)
-            else:
-                self.server.client.send(msg)        
+    def send_osc_messages(self, client=None):
+        """ Sends all compiled osc messages to the SuperCollider server, or
+            to `client` if one is given """
+        messages = self.osc_messages
+        if client is None and self.server.packet_size > 0:
+            messages = self.server.coalesce(messages)
+        if client is not None:
+            for msg in messages:
+                client.send(msg)
+            return
+        midi = [msg for msg in messages if msg.address == "/foxdot_midi"]
+        if len(midi):
+            self.server.send_packets(self.server.sclang, midi)
+        if len(midi) < len(messages):
+            self.server.send_packets(self.server.client, [msg for msg in messages if msg.address != "/foxdot_midi"])
         return
 
+    @staticmethod
+    def key(item):
+        """ Returns the key used to look up a QueueObj or the object it wraps """
+        return id(item.obj) if isinstance(item, QueueObj) else id(item)
+
     def called(self, item):
         """ Returns True if the item is in this QueueItem and has already been called """
-        return item in self.called_events
+        return self.key(item) in self.called_events
 
     def call(self, item, caller = None):
-        """ Calls all items in queue slot """
-        # TODO -> Make more efficient -> and understand what is going on
-        
-        if caller is not None:
-
-            correct = (caller in self.objects())
-
-            for event in self:
+        """ Calls the item (a QueueObj or the object itself) if it hasn't
+            already been called. If `caller` is given, it must also be in
+            this QueueItem """
 
-                if item == event.obj:
+        if caller is not None and id(caller) not in self.objs:
 
-                    item = event
+            return
 
-                    break
+        key = self.key(item)
 
-        else:
-
-            correct = True
+        if key in self.objs and key not in self.called_events:
 
-        # item is a QueueObj OR the object itself
+            # Mark first so that objects that refer to each other aren't called again
 
-        if correct and (item in self) and (item not in self.called_events):
-            
-            self[item].__call__()
-            self.called_events.append(item)
+            self.called_events.add(key)
+            self.objs[key].__call__()
 
         return
 
     def __getitem__(self, key):
-        for event in self:
-            if event == key:
-                return event # Possible need to be key.obj?
+        return self.objs.get(self.key(key))
+
+    def __contains__(self, item):
+        return self.key(item) in self.objs
 
     def __iter__(self):
         return (item for level in self.events for item in level)
 
     def __len__(self):
-        return sum([len(level) for level in self.events])
+        return len(self.objs)
 
     def objects(self):
-        return [item.obj for level in self.events for item in level]
+        return [item.obj for item in self]
         
 
 class QueueObj(object):
@@ -560,6 +860,157 @@ class QueueObj(object):
     def __call__(self):
         self.obj.__call__(*self.args, **self.kwargs)
 
+class WorkerPool(object):
+    """ A fixed number of persistent threads that execute the blocks popped
+        from the Queue, instead of starting a new thread for every block.
+        `overruns` counts the blocks that were submitted while every worker
+        was still busy with an earlier block. If `max_pending` blocks are
+        already waiting, new blocks are dropped (and counted in `dropped`)
+        so that the clock thread is never held up """
+    def __init__(self, func, size=1, max_pending=64):
+        self.func     = func
+        self.jobs     = JobQueue(max_pending)
+        self.lock     = threading.Lock()
+        self.size     = 0
+        self.busy     = 0
+        self.overruns = 0
+        self.dropped  = 0
+        self.resize(size)
+
+    def __repr__(self):
+        return "<WorkerPool size={} busy={} depth={} overruns={} dropped={}>".format(self.size, self.busy, self.depth(), self.overruns, self.dropped)
+
+    def resize(self, size):
+        """ Starts or stops workers until there are `size` of them """
+        size = max(1, int(size))
+        with self.lock:
+            while self.size < size:
+                worker = threading.Thread(target=self.work)
+                worker.daemon = True
+                worker.start()
+                self.size += 1
+            stopping = max(0, self.size - size)
+            self.size -= stopping
+        # Workers need the lock to take a job, so wait for room in the queue without it
+        for i in range(stopping):
+            self.jobs.put(None) # Tells one worker to stop
+        return
+
+    def depth(self):
+        """ Returns the number of blocks waiting for a worker """
+        return self.jobs.qsize()
+
+    def submit(self, block):
+        """ Hands a block to the next available worker """
+        if self.busy >= self.size or not self.jobs.empty():
+            self.overruns += 1
+        try:
+            self.jobs.put_nowait(block)
+        except JobQueueFull:
+            self.dropped += 1
+        return
+
+    def work(self):
+        """ Main loop for each worker thread """
+        while True:
+            block = self.jobs.get()
+            if block is None:
+                return
+            with self.lock:
+                self.busy += 1
+            try:
+                self.func(block)
+            except:
+                print(error_stack())
+            finally:
+                with self.lock:
+                    self.busy -= 1
+
+class RollingHistogram(object):
+    """ Keeps the last `size` values of a timing measurement (in seconds) """
+
+    # Upper edges of the histogram buckets
+    edges = (0, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, float("inf"))
+
+    def __init__(self, size=1000):
+        self.values = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value):
+        self.values.append(value)
+        return
+
+    def percentile(self, p, values=None):
+        """ Returns the value below which `p` percent of the values fall """
+        values = sorted(self.values) if values is None else values
+        if len(values) == 0:
+            return 0
+        return values[int(round((p / 100) * (len(values) - 1)))]
+
+    def histogram(self, values=None):
+        """ Returns a list of (upper edge, count) tuples """
+        values = sorted(self.values) if values is None else values
+        counts = [0] * len(self.edges)
+        i = 0
+        for value in values:
+            while value > self.edges[i]:
+                i += 1
+            counts[i] += 1
+        return list(zip(self.edges, counts))
+
+    def as_dict(self):
+        values = sorted(self.values)
+        return { "count" : len(values),
+                 "mean"  : (sum(values) / len(values)) if values else 0,
+                 "min"   : values[0] if values else 0,
+                 "max"   : values[-1] if values else 0,
+                 "p50"   : self.percentile(50, values),
+                 "p95"   : self.percentile(95, values),
+                 "p99"   : self.percentile(99, values),
+                 "histogram" : self.histogram(values) }
+
+class ClockMetrics(object):
+    """ Timing measurements for the blocks run by a TempoClock """
+    def __init__(self, size=1000):
+        self.wake     = RollingHistogram(size)
+        self.block    = RollingHistogram(size)
+        self.headroom = RollingHistogram(size)
+        self.blocks   = 0
+        self.bundles  = 0
+        self.late     = 0
+
+    def add_block(self, duration):
+        """ Stores the time taken to run a block """
+        self.blocks += 1
+        self.block.add(duration)
+        return
+
+    def add_sent(self, messages):
+        """ Stores how far ahead of their timestamps messages are about to be
+            sent. Returns the number of messages that are late """
+        now  = time()
+        late = 0
+        for msg in messages:
+            timetag = getattr(msg, "timetag", 0)
+            if timetag > 0:
+                headroom = timetag - now
+                self.headroom.add(headroom)
+                if headroom < 0:
+                    late += 1
+        self.bundles += len(messages)
+        self.late    += late
+        return late
+
+    def as_dict(self):
+        return { "blocks"       : self.blocks,
+                 "bundles"      : self.bundles,
+                 "late_bundles" : self.late,
+                 "wake"         : self.wake.as_dict(),
+                 "block"        : self.block.as_dict(),
+                 "headroom"     : self.headroom.as_dict() }
+
 ###############################################################
 """ 
         TempoClock.Wrapper Class
@@ -0,0 +1,279 @@
+"""
+    benchmark.py
+    ============
+
+    Measures how fast FoxDot can schedule and build events using a synthetic
+    load of N players, each with M varying attributes and K effects. The
+    SuperCollider server does not need to be running: every message is sent
+    to a local UDP socket that throws it away.
+
+    ```
+    python benchmark.py --players 32 --attributes 4 --effects 2
+    ```
+
+    Each benchmark reports the number of events, events per second, the time
+    taken per event (in microseconds) and the growth in peak memory (in KB).
+    For the Clock, each event is a block of events due at the same time.
+
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import random
+import socket
+import threading
+from time import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import FoxDot
+
+from FoxDot import Clock, Server, Player, PDur, pads, play
+from FoxDot.lib.TempoClock import Queue, QueueItem
+from FoxDot.lib.Patterns.Main import metaPattern
+
+# Attributes that can be given a varying pattern and a function to make values
+
+ATTRIBUTES = [ ("amp",   lambda: random.choice([0.5, 0.75, 1])),
+               ("pan",   lambda: random.choice([-1, -0.5, 0, 0.5, 1])),
+               ("oct",   lambda: random.choice([4, 5, 6])),
+               ("sus",   lambda: random.choice([0.25, 0.5, 1, 2])),
+               ("rate",  lambda: random.choice([0.5, 1, 2])),
+               ("vib",   lambda: random.choice([0, 2, 4])),
+               ("fmod",  lambda: random.choice([0, 1, 2])),
+               ("delay", lambda: random.choice([0, 0, 0.25, (0, 0.125)])),
+               ("chop",  lambda: random.choice([0, 2, 4])) ]
+
+DURATIONS = [ [0.25], [0.5, 0.25, 0.25], PDur(3, 8), [1, 0.5, 0.5], [0.75, 0.75, 0.5] ]
+
+DEGREES = [ [0, 2, 4, 7], [0, (0, 2, 4), 3, (3, 5)], [0, 1, 2, 3, 4, 5, 6, 7], [0, [2, 4], 3, [5, 7, 9]] ]
+
+class UDPSink(object):
+    """ Receives and discards datagrams on a local port """
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.address  = self.socket.getsockname()
+        self.received = 0
+        self.thread = threading.Thread(target=self.listen)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def listen(self):
+        while True:
+            self.socket.recv(65536)
+            self.received += 1
+
+class CountingClient(object):
+    """ Passes messages on to an OSCClient and counts them """
+    def __init__(self, client):
+        self.client = client
+        self.count  = 0
+
+    def send(self, msg, timeout=None):
+        self.count += 1
+        self.client.send(msg)
+
+def peak_memory():
+    """ Returns the peak memory use of this process in KB, if known """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def percentile(values, p):
+    if len(values) == 0:
+        return 0
+    return values[int(round((p / 100) * (len(values) - 1)))]
+
+def result(name, events, seconds, times=None, memory=0):
+    """ Returns a dictionary describing a benchmark's results """
+    times = sorted(times) if times else []
+    return { "name"    : name,
+             "events"  : events,
+             "rate"    : (events / seconds) if seconds > 0 else 0,
+             "p50"     : percentile(times, 50) * 1e6,
+             "p95"     : percentile(times, 95) * 1e6,
+             "p99"     : percentile(times, 99) * 1e6,
+             "memory"  : memory }
+
+def make_players(n, attributes, effects):
+    """ Returns `n` Players playing with `attributes` varying patterns and `effects` effects """
+
+    fx_keys = [key for key in Player.fx_keys if key not in ("chop",)][:effects]
+
+    players = []
+
+    for i in range(n):
+
+        kwargs = {"dur": DURATIONS[i % len(DURATIONS)]}
+
+        for name, value in ATTRIBUTES[:attributes]:
+
+            kwargs[name] = [value() for j in range(random.randint(1, 7))]
+
+        for key in fx_keys:
+
+            kwargs[key] = random.choice([0.25, 0.5, 1])
+
+        player = Player()
+
+        if i % 4 == 3:
+
+            player >> play("x-o-[--]", **kwargs)
+
+        else:
+
+            player >> pads(DEGREES[i % len(DEGREES)], **kwargs)
+
+        players.append(player)
+
+    return players
+
+def bench_queue(events):
+    """ Adds `events` callables to a Queue then pops every block """
+    queue = Queue()
+    func  = lambda: None
+    ticks = [random.randint(0, events // 4) for i in range(events)]
+    times = []
+    memory = peak_memory()
+    start = time()
+    for tick in ticks:
+        t = time()
+        queue.add(func, tick)
+        times.append(time() - t)
+    while len(queue):
+        queue.pop()
+    return result("Queue.add / pop", events, time() - start, times, peak_memory() - memory)
+
+def bench_player_call(players, events):
+    """ Calls each Player in turn, as the Clock would """
+    times = []
+    memory = peak_memory()
+    start = time()
+    for i in range(events):
+        player = players[i % len(players)]
+        player.queue_block = QueueItem(player, 0)
+        t = time()
+        player.__call__()
+        times.append(time() - t)
+    return result("Player.__call__", events, time() - start, times, peak_memory() - memory)
+
+def bench_player_send(players, events):
+    """ Sends the current event of each Player in turn """
+    for player in players:
+        player.get_event()
+    times = []
+    memory = peak_memory()
+    start = time()
+    for i in range(events):
+        player = players[i % len(players)]
+        player.queue_block = QueueItem(player, 0)
+        t = time()
+        player.send()
+        times.append(time() - t)
+    return result("Player.send", events, time() - start, times, peak_memory() - memory)
+
+def bench_get_bundle(players, events):
+    """ Builds OSC bundles from each Player's current event """
+    packets = []
+    for player in players:
+        player.get_event()
+        message, effects = player.osc_message(0)
+        packets.append((player.get_synth_name(message.get("buf", 0)), message, effects))
+    times = []
+    memory = peak_memory()
+    start = time()
+    for i in range(events):
+        synthdef, message, effects = packets[i % len(packets)]
+        t = time()
+        Server.get_bundle(synthdef, dict(message), effects, timestamp=1)
+        times.append(time() - t)
+    return result("Server.get_bundle", events, time() - start, times, peak_memory() - memory)
+
+def bench_clock(beats):
+    """ Renders `beats` beats with the Clock as fast as possible, one block at a time """
+    client = CountingClient(Server.client)
+    end = Clock.tick + Clock.beats_to_ticks(beats)
+    times = []
+    memory = peak_memory()
+    start = time()
+    while Clock.tick < end:
+        t = time()
+        Clock.render(Clock.ticks_to_beats(min(Clock.queue.next(), end) - Clock.tick), client)
+        times.append(time() - t)
+    return result("Clock.render", len(times), time() - start, times, peak_memory() - memory)
+
+def offline(func, *args):
+    """ Returns func(*args) called from inside Clock.render() so that Players
+        can be created and called without the real time clock running """
+    values = []
+    client = CountingClient(Server.client)
+    # Schedule far enough ahead that the clock thread stops before it's due
+    Clock.schedule(lambda: values.append(func(*args)), Clock.now() + 64)
+    Clock.render(0, client)
+    Clock.render(Clock.ticks_to_beats(Clock.queue.next() - Clock.tick), client)
+    return values[0]
+
+def bench_players(players, attributes, effects, events):
+    """ Runs each benchmark that uses Players """
+    group = make_players(players, attributes, effects)
+    return [ bench_player_call(group, events),
+             bench_player_send(group, events),
+             bench_get_bundle(group, events) ]
+
+def run(players=16, attributes=3, effects=2, events=5000, beats=64, seed=0, flat_size=None):
+    """ Runs every benchmark and returns a list of results """
+
+    random.seed(seed)
+
+    if flat_size is not None:
+
+        metaPattern.flat_size = flat_size
+
+    # Send everything to a local socket instead of SuperCollider
+
+    sink = UDPSink()
+
+    Server.client.connect(sink.address)
+    Server.sclang.connect(sink.address)
+
+    results = [ bench_queue(events) ]
+
+    results.extend(offline(bench_players, players, attributes, effects, events))
+
+    # Start again from the first bar
+
+    Clock.clear()
+
+    group = offline(make_players, players, attributes, effects)
+
+    results.append(bench_clock(beats))
+
+    Clock.clear()
+
+    return results
+
+def report(results):
+    print("{:<20} {:>8} {:>12} {:>10} {:>10} {:>10} {:>10}".format("benchmark", "events", "events/s", "p50 (us)", "p95 (us)", "p99 (us)", "mem (KB)"))
+    for row in results:
+        print("{name:<20} {events:>8} {rate:>12.1f} {p50:>10.1f} {p95:>10.1f} {p99:>10.1f} {memory:>10}".format(**row))
+    return
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark FoxDot's scheduler and event pipeline")
+    parser.add_argument("--players",    type=int, default=16,   help="number of players (N)")
+    parser.add_argument("--attributes", type=int, default=3,    help="varying attributes per player (M)")
+    parser.add_argument("--effects",    type=int, default=2,    help="effects per player (K)")
+    parser.add_argument("--events",     type=int, default=5000, help="events for each micro-benchmark")
+    parser.add_argument("--beats",      type=int, default=64,   help="beats to render with the Clock")
+    parser.add_argument("--seed",       type=int, default=0,    help="random seed")
+    parser.add_argument("--flat-size",  type=int, default=None, help="largest nested Pattern to look up from a table (0 to turn off)")
+
+    args = parser.parse_args()
+
+    report(run(args.players, args.attributes, args.effects, args.events, args.beats, args.seed, args.flat_size))